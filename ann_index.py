@@ -0,0 +1,221 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+
+
+ANN_INDEX_FILE = "ann.faiss"  # Search index, next to the exact index.faiss kept for incremental updates
+ANN_META_FILE = "ann.json"
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+VECTOR_STORAGES = ("float32", "float16", "int8")  # How the search index stores each vector
+VECTOR_STORAGE = "float32"
+TRAIN_SAMPLE_SIZE = 100_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_SUBVECTOR_DIMS = 8  # all-MiniLM-L6-v2 is 384-d -> 48 sub-quantizers of 8 bits each
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+RECALL_QUERIES = 200
+RECALL_K = 10
+
+
+def choose_index_type(n_vectors):
+    # Exact search is fast enough (and perfectly accurate) for small corpora
+    if n_vectors < 20_000:
+        return "flat"
+    if n_vectors < 200_000:
+        return "hnsw"
+    if n_vectors < 2_000_000:
+        return "ivf_flat"
+    return "ivf_pq"
+
+def _n_lists(n_vectors):
+    # ~4*sqrt(N) lists, but keep at least ~39 training points per list (FAISS's minimum)
+    return int(max(1, min(4 * math.sqrt(n_vectors), n_vectors // 39)))
+
+def _min_vectors(index_type):
+    return {"flat": 1, "hnsw": 1, "ivf_flat": 39 * 16, "ivf_pq": 39 * 256}[index_type]
+
+def _training_sample(vectors, sample_size=TRAIN_SAMPLE_SIZE):
+    if len(vectors) <= sample_size:
+        return vectors
+    rows = np.random.default_rng(0).choice(len(vectors), size=sample_size, replace=False)
+    return vectors[np.sort(rows)]
+
+def _scalar_quantizer_type(storage):
+    return {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}[storage]
+
+def build_index(vectors, index_type, storage=VECTOR_STORAGE):
+    """
+    Builds a FAISS index of the given type over an (N, d) float32 array. Returns (index, params).
+
+    storage="float16"/"int8" keeps the vectors scalar-quantized (2 or 1 byte per dimension
+    instead of 4) in flat, hnsw and ivf_flat indexes; ivf_pq is already compressed and
+    ignores it.
+    """
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Unknown vector storage '{storage}'. Expected one of {VECTOR_STORAGES}.")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    params = {}
+    quantized = storage != "float32"
+
+    if index_type == "flat":
+        if quantized:
+            index = faiss.IndexScalarQuantizer(dim, _scalar_quantizer_type(storage))
+            index.train(_training_sample(vectors))  # Learns the per-dimension int8 range
+        else:
+            index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        if quantized:
+            index = faiss.IndexHNSWSQ(dim, _scalar_quantizer_type(storage), HNSW_M)
+            index.train(_training_sample(vectors))
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        params = {"M": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        n_lists = _n_lists(n_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat" and quantized:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, n_lists, _scalar_quantizer_type(storage),
+                                                  faiss.METRIC_L2)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, n_lists)
+        else:
+            n_subquantizers = dim // PQ_SUBVECTOR_DIMS
+            index = faiss.IndexIVFPQ(quantizer, dim, n_lists, n_subquantizers, 8)
+            params["pq_m"] = n_subquantizers
+        index.train(_training_sample(vectors))
+        params["nlist"] = n_lists
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+    index.add(vectors)
+    params["storage"] = "pq" if index_type == "ivf_pq" else storage
+    return index, params
+
+def index_nbytes(index):
+    """Serialized size of an index, i.e. roughly what it occupies on disk and, once paged in, in RAM."""
+    return int(faiss.serialize_index(index).nbytes)
+
+def apply_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+def recall_at_k(index, exact_index, queries, k=RECALL_K, exclude_ids=None):
+    """
+    Fraction of the exact top-k neighbours that the approximate index also returns.
+
+    exclude_ids (one per query) holds out a query that was taken from the index itself: its
+    exact self-match, which every index finds trivially, is dropped from both result lists.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    fetch = k if exclude_ids is None else k + 1
+    _, approx_ids = index.search(queries, fetch)
+    _, exact_ids = exact_index.search(queries, fetch)
+    found = total = 0
+    for row, (a, e) in enumerate(zip(approx_ids, exact_ids)):
+        skip = -1 if exclude_ids is None else exclude_ids[row]
+        a = [i for i in a if i >= 0 and i != skip][:k]
+        e = [i for i in e if i >= 0 and i != skip][:k]
+        found += len(set(a) & set(e))
+        total += len(e)
+    return found / max(1, total)
+
+def build_ann_from_flat(exact_index, index_type=None, db_dir="./faiss_index",
+                        nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH, storage=VECTOR_STORAGE, queries=None):
+    """
+    Builds and persists a search index for the vectors held in an exact (flat) index.
+
+    index_type=None picks a type from the vector count. A float32 flat index needs no
+    separate search index, so any stale ANN files are removed; with float16/int8 storage a
+    scalar-quantized copy is written instead. Returns the metadata written to ann.json.
+
+    Recall is measured with `queries` (e.g. real query embeddings) when given; otherwise with
+    a sample of the indexed vectors, each held out from its own results.
+    """
+    n_vectors = exact_index.ntotal
+    index_type = index_type or choose_index_type(n_vectors)
+    if n_vectors < _min_vectors(index_type):
+        print(f"⚠️ {n_vectors} vectors is too few to train '{index_type}', using 'flat' instead.")
+        index_type = "flat"
+
+    meta = {"index_type": index_type, "n_vectors": n_vectors, "nprobe": nprobe, "ef_search": ef_search}
+    if index_type == "flat" and storage == "float32":
+        remove_ann_index(db_dir)
+        meta["storage"] = storage
+        meta["recall_at_k"] = 1.0
+        return meta
+
+    vectors = exact_index.reconstruct_n(0, n_vectors)
+    index, params = build_index(vectors, index_type, storage)
+    apply_search_params(index, nprobe, ef_search)
+    meta.update(params)
+    meta["index_bytes"] = index_nbytes(index)
+    meta["flat_bytes"] = index_nbytes(exact_index)
+
+    meta["recall_k"] = RECALL_K
+    if queries is not None and len(queries):
+        meta["recall_queries"] = "given"
+        meta["recall_at_k"] = round(recall_at_k(index, exact_index, queries), 4)
+    else:
+        query_rows = np.random.default_rng(1).choice(n_vectors, size=min(RECALL_QUERIES, n_vectors), replace=False)
+        meta["recall_queries"] = "held_out_vectors"
+        meta["recall_at_k"] = round(recall_at_k(index, exact_index, vectors[query_rows], exclude_ids=query_rows), 4)
+    print(f"🧭 Built {index_type} ({meta['storage']}) index over {n_vectors} vectors; "
+          f"recall@{RECALL_K} vs flat = {meta['recall_at_k']}; "
+          f"{meta['index_bytes'] / 1e6:.1f} MB vs {meta['flat_bytes'] / 1e6:.1f} MB flat")
+
+    os.makedirs(db_dir, exist_ok=True)
+    write_index_atomic(index, os.path.join(db_dir, ANN_INDEX_FILE))
+    with open(os.path.join(db_dir, ANN_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def remove_ann_index(db_dir):
+    for name in (ANN_INDEX_FILE, ANN_META_FILE):
+        path = os.path.join(db_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def load_ann_meta(db_dir):
+    meta_path = os.path.join(db_dir, ANN_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_index_atomic(index, path):
+    # Never truncate a file that a loaded index may still have memory-mapped
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def read_index_mmap(path):
+    """
+    Reads an index with its bulk data memory-mapped where this FAISS build allows it.
+
+    IO_FLAG_MMAP alone only maps IVF inverted lists. IO_FLAG_MMAP_IFC (newer FAISS) also maps
+    the code arrays of flat and scalar-quantized indexes, including HNSW's vector storage;
+    the HNSW graph and IVF coarse quantizer are still read into RAM. Without it, non-IVF
+    indexes are read fully into RAM.
+    """
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)  # Index type this FAISS build cannot map
+
+def load_search_index(db_dir, nprobe=None, ef_search=None):
+    """Loads the index used for searching: the ANN index if one was built, else the flat index."""
+    meta = load_ann_meta(db_dir)
+    if meta is None:
+        return read_index_mmap(os.path.join(db_dir, "index.faiss"))
+    index = read_index_mmap(os.path.join(db_dir, ANN_INDEX_FILE))
+    return apply_search_params(index, nprobe or meta["nprobe"], ef_search or meta["ef_search"])
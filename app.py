@@ -1,11 +1,33 @@
 import streamlit as st
-from datetime import datetime
-from langchain.memory import ConversationBufferMemory
-from embeddings import clear_faiss_index, save_uploaded_files, embed_files_from_paths, load_faiss_index
+import time
+import uuid
+from conversation_memory import MEMORY_MODES, make_memory
+from embeddings import (
+    clear_collection,
+    save_uploaded_files,
+    embed_files_from_paths,
+    list_uploaded_files,
+    list_collections,
+    collection_exists,
+    collection_shard_dirs,
+    collection_upload_dir,
+    load_collection_meta,
+    validate_collection_name,
+    DEFAULT_COLLECTION,
+    DEFAULT_N_SHARDS,
+    migrate_legacy_layout,
+)
+from ann_index import INDEX_TYPES, VECTOR_STORAGES, load_ann_meta
+from registry import index_registry
+from telemetry import trace_turn, get_query_log, stage_stats, profile_run
 from generation import (
     get_llm_chain,
+    stream_answer,
+    searched_as_asked,
     speak_text,
-    listen_query,
+    stop_speaking,
+    is_speaking,
+    start_background_listener,
     LISTENING_TIMEOUT,
     STOP_COMMAND_RECEIVED,
     SPEECH_RECOGNITION_ERROR # Note: This is SPEECH_RECOGNITION_ERROR_PREFIX in generation.py
@@ -76,17 +98,45 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# --- SHARED MODEL & INDEX ---
+@st.cache_resource
+def migrate_once():
+    # Runs once per process, not on every rerun or in every session
+    migrate_legacy_layout()
+
+migrate_once()
+# Loaded once per process and shared by every session; a no-op on later reruns
+index_registry.warm()
+
 # --- SESSION STATE INITIALIZATION ---
+if "active_collection" not in st.session_state: # Collection that uploads and re-embeds go to
+    st.session_state.active_collection = DEFAULT_COLLECTION
+if "query_collections" not in st.session_state: # Collections the voice chat searches
+    st.session_state.query_collections = [DEFAULT_COLLECTION]
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "memory_mode" not in st.session_state: # "budgeted" (window + summary under a token cap) or "buffer"
+    st.session_state.memory_mode = "budgeted"
+if "condense_fast_path" not in st.session_state: # Skip the condensing LLM call for self-contained questions
+    st.session_state.condense_fast_path = True
 if "memory" not in st.session_state:
-    st.session_state.memory = ConversationBufferMemory(
-        memory_key="chat_history", return_messages=True, output_key="answer"
-    )
+    st.session_state.memory = make_memory(st.session_state.memory_mode)
+    st.session_state.memory_built_mode = st.session_state.memory_mode
+if "usage_totals" not in st.session_state: # LLM calls / estimated prompt tokens spent and saved this session
+    st.session_state.usage_totals = {"llm_calls": 0, "prompt_tokens": 0, "saved_llm_calls": 0, "saved_prompt_tokens": 0}
+
+
+def query_collections_ready():
+    return any(collection_exists(c) for c in st.session_state.query_collections)
+
 if "embedding_created" not in st.session_state:
-    st.session_state.embedding_created = os.path.exists("./faiss_index")
+    st.session_state.embedding_created = query_collections_ready()
+elif not st.session_state.embedding_created and query_collections_ready():
+    st.session_state.embedding_created = True  # Another session built the shared index
 if "qa_chain" not in st.session_state:
     st.session_state.qa_chain = None
+if "qa_chain_collections" not in st.session_state: # Collections the current qa_chain was built for
+    st.session_state.qa_chain_collections = None
 # --- Voice Loop Specific Session States ---
 if "listening_active" not in st.session_state:
     st.session_state.listening_active = False
@@ -96,15 +146,181 @@ if "status_message" not in st.session_state: # To display messages like "Listeni
     st.session_state.status_message = ""
 if "speak_next_answer" not in st.session_state: # Flag to control speaking
     st.session_state.speak_next_answer = ""
+if "listener" not in st.session_state: # BackgroundListener while voice chat is active
+    st.session_state.listener = None
+if "turn_timings" not in st.session_state: # Time-to-first-token / total latency per streamed turn
+    st.session_state.turn_timings = []
+if "voice_timings" not in st.session_state: # listen/recognition seconds behind the pending query
+    st.session_state.voice_timings = {}
+if "speak_turn_id" not in st.session_state: # Tags the TTS log record of speak_next_answer
+    st.session_state.speak_turn_id = None
+
+
+def stop_background_listener():
+    if st.session_state.listener is not None:
+        st.session_state.listener.stop()
+        st.session_state.listener = None
 
+def create_collection():
+    # Button callback: runs before the rerun, so it may set the selectbox's state
+    name = st.session_state.new_collection_name.strip()
+    try:
+        validate_collection_name(name)
+    except ValueError as e:
+        st.session_state.status_message = f"⚠️ {e}"
+        return
+    os.makedirs(collection_upload_dir(name), exist_ok=True)
+    st.session_state.active_collection = name
+    st.session_state.new_collection_name = ""
+
+def apply_search_params():
+    # on_change callback: the registry setting is process-wide, so it changes only when this
+    # session's user edits a field, never merely because a rerun still holds an old value
+    index_registry.set_search_params(int(st.session_state.nprobe_input) or None,
+                                     int(st.session_state.ef_search_input) or None)
+
+
+VOICE_POLL_SECONDS = 0.25  # How often the voice fragment checks the listener's queue
+
+@st.fragment(run_every=VOICE_POLL_SECONDS)
+def poll_voice_input():
+    # Reruns on its own every VOICE_POLL_SECONDS while on the page, so waiting for speech only
+    # redraws this status line; the whole app reruns (st.rerun) once the listener has a result
+    if not st.session_state.listening_active or st.session_state.user_query_for_processing:
+        return  # A tick that arrived after the app already moved on
+
+    # Don't open the microphone while the bot is still talking (it would hear itself)
+    if is_speaking():
+        st.info("🔊 Speaking... listening resumes when the answer finishes.")
+        return
+
+    # The background listener keeps capturing between reruns; we only poll its queue here
+    if st.session_state.listener is None:
+        st.session_state.listener = start_background_listener(phrase_time_limit=12)
+    listener_failed = st.session_state.listener.failed()  # Checked first: its error is queued by then
+    query_result = st.session_state.listener.poll()
+    if query_result is None and listener_failed:
+        query_result = SPEECH_RECOGNITION_ERROR + "::The microphone listener stopped"
+
+    if query_result is None:
+        st.info("🎤 Listening... Say 'stop listening' or 'goodbye' to end.")
+        return
+    elif query_result == LISTENING_TIMEOUT:
+        st.session_state.status_message = "⏱️ Didn't catch that. Try speaking again."
+        # Potentially speak this message too
+        # st.session_state.speak_next_answer = "I didn't catch that."
+        st.rerun()
+    elif query_result == STOP_COMMAND_RECEIVED:
+        st.session_state.listening_active = False
+        stop_background_listener()
+        st.session_state.status_message = "🛑 Voice chat ended by command."
+        st.session_state.speak_next_answer = "Okay, ending voice chat."
+        st.rerun()
+    elif query_result and query_result.startswith(SPEECH_RECOGNITION_ERROR): # Check prefix
+        error_msg = query_result.split("::", 1)[1] if "::" in query_result else "Unknown speech error"
+        st.session_state.status_message = f"⚠️ Speech Recognition Error: {error_msg}. Try again."
+        st.session_state.chat_history.append( (f"SR Attempt Failed", f"Error: {error_msg}", []) )
+        st.session_state.speak_next_answer = f"I had a speech recognition error: {error_msg}. Please try again."
+        if listener_failed:
+            # The microphone itself failed; reopening it every rerun would fail the same way
+            st.session_state.listening_active = False
+            stop_background_listener()
+            st.session_state.status_message = f"⚠️ Voice chat stopped: {error_msg}"
+            st.session_state.speak_next_answer = f"Voice chat stopped because of an error: {error_msg}."
+        st.rerun()
+    elif query_result: # Valid query received
+        st.session_state.user_query_for_processing = query_result
+        st.session_state.voice_timings = st.session_state.listener.last_timings
+        st.session_state.status_message = f"✅ You said: \"{query_result}\". Processing..."
+        st.rerun() # Rerun to move to processing phase
+    else: # Should ideally not be reached if the listener is robust
+        st.session_state.status_message = "⚠️ No query captured. Listening again..."
+        st.rerun()
 
 # --- SIDEBAR STATUS ---
 with st.sidebar:
+    st.header("📚 Collections")
+    known_collections = sorted(
+        set(list_collections()) | {DEFAULT_COLLECTION, st.session_state.active_collection}
+        | set(st.session_state.query_collections)
+    )
+    st.selectbox("Upload to collection", known_collections, key="active_collection")
+    st.multiselect("Search collections", known_collections, key="query_collections",
+                   help="Only the collections searched are loaded into memory.")
+    with st.expander("🧭 ANN search parameters (all sessions)"):
+        # Seeded from the registry on every run, so changes made in other sessions show up here
+        st.session_state.nprobe_input = index_registry.nprobe or 0
+        st.session_state.ef_search_input = index_registry.ef_search or 0
+        st.number_input("nprobe (IVF)", min_value=0, max_value=65536, key="nprobe_input", on_change=apply_search_params,
+                        help="Inverted lists probed per query; 0 uses each index's stored value.")
+        st.number_input("efSearch (HNSW)", min_value=0, max_value=65536, key="ef_search_input",
+                        on_change=apply_search_params,
+                        help="HNSW candidate list size per query; 0 uses each index's stored value.")
+    with st.expander("➕ New collection"):
+        st.text_input("Name (letters, digits, '-' and '_')", key="new_collection_name")
+        st.button("Create", key="create_collection_button", on_click=create_collection)
+    if st.session_state.query_collections != st.session_state.qa_chain_collections:
+        st.session_state.qa_chain = None  # Rebuilt below with a retriever over the new selection
+        st.session_state.embedding_created = query_collections_ready()
+
+    st.header("🧠 Conversation Memory")
+    st.selectbox("Memory mode", MEMORY_MODES, key="memory_mode",
+                 help="'budgeted' keeps recent turns plus a running summary under a token cap; "
+                      "'buffer' keeps the whole conversation.")
+    st.checkbox("Skip condensing for self-contained questions", key="condense_fast_path")
+    if st.session_state.memory_mode != st.session_state.memory_built_mode:
+        st.session_state.memory = make_memory(st.session_state.memory_mode, st.session_state.memory.chat_memory.messages)
+        st.session_state.memory_built_mode = st.session_state.memory_mode
+        st.session_state.qa_chain = None  # The chain holds the old memory object
+    usage_totals = st.session_state.usage_totals
+    if usage_totals["llm_calls"] or usage_totals["saved_llm_calls"]:
+        st.markdown(
+            f"**🪙 LLM Usage:** `{usage_totals['llm_calls']}` calls · ~`{usage_totals['prompt_tokens']}` prompt tokens  \n"
+            f"**💸 Saved:** `{usage_totals['saved_llm_calls']}` calls · ~`{usage_totals['saved_prompt_tokens']}` prompt tokens"
+        )
+
     st.header("⚙️ System Status")
     st.markdown(f"**✅ Embeddings Ready:** {'Yes' if st.session_state.embedding_created else 'No'}")
+    st.markdown(f"**🗄️ Shared Index Version:** `{index_registry.version}`")
+    if st.session_state.embedding_created:
+        for collection in st.session_state.query_collections:
+            shard_dirs = collection_shard_dirs(collection)
+            if not shard_dirs:
+                continue
+            ann_metas = [meta for meta in map(load_ann_meta, shard_dirs) if meta]
+            if ann_metas:
+                index_types = ", ".join(sorted({meta["index_type"] for meta in ann_metas}))
+                storages = ", ".join(sorted({meta.get("storage", "float32") for meta in ann_metas}))
+                st.markdown(
+                    f"**🧭 {collection}:** `{len(shard_dirs)}` shard(s) · `{index_types}` ({storages}) over "
+                    f"`{sum(meta['n_vectors'] for meta in ann_metas)}` chunks "
+                    f"(min recall@{ann_metas[0]['recall_k']} vs flat: "
+                    f"`{min(meta['recall_at_k'] for meta in ann_metas):.3f}`)"
+                )
+            else:
+                st.markdown(f"**🧭 {collection}:** `{len(shard_dirs)}` shard(s) · `flat` (exact)")
+    if index_registry.is_loaded():
+        loaded = ", ".join(f"{name} ({n})" for name, n in index_registry.loaded_collections().items())
+        st.markdown(f"**💾 Loaded Collections (shards):** {loaded}")
     st.markdown(f"**🎙️ Voice Chat Active:** {'<span style=''color:green;''>Yes</span>' if st.session_state.listening_active else '<span style=''color:red;''>No</span>'}", unsafe_allow_html=True)
     st.markdown(f"**💬 Chat Turns:** `{len(st.session_state.chat_history)}`")
+    if st.session_state.turn_timings:
+        last_timing = st.session_state.turn_timings[-1]
+        st.markdown(f"**⏱️ Last Answer:** first token `{last_timing['ttft']:.2f}s` · total `{last_timing['total']:.2f}s`")
+    if index_registry.is_loaded():
+        with st.expander("🗃️ Query Caches"):
+            for cache_name, stats in index_registry.cache_stats().items():
+                st.markdown(
+                    f"**{cache_name.replace('_', ' ').title()}:** "
+                    f"`{stats['hits']}` hits · `{stats['misses']}` misses · `{stats['evictions']}` evictions"
+                )
+    stage_rows = stage_stats.percentiles()
+    if stage_rows:
+        with st.expander("⏱️ Stage Latency (rolling)"):
+            st.table(stage_rows)
     if st.button("Clear Chat History & Memory", key="clear_history_sidebar"):
+        stop_speaking()
+        stop_background_listener()
         st.session_state.chat_history = []
         st.session_state.memory.clear()
         st.session_state.listening_active = False
@@ -118,24 +334,90 @@ tab1, tab2, tab3 = st.tabs(["📁 Upload & Embed PDFs", "🎙️ Ask Question",
 
 # --- UPLOAD PDFs TAB ---
 with tab1:
-    st.subheader("📤 Upload PDFs")
+    active_collection = st.session_state.active_collection
+    st.subheader(f"📤 Upload PDFs to `{active_collection}`")
     st.markdown(
-        "Upload new PDFs here. **Note:** Uploading new files will clear the existing index and embeddings."
+        "Upload new PDFs here. New or changed files are added to the collection's index; "
+        "files already embedded are skipped. Tick **Rebuild from scratch** to clear the collection's index first."
     )
     uploaded_files = st.file_uploader(
         "Select PDF(s)", type=["pdf"], accept_multiple_files=True, key="pdf_uploader"
     )
+    rebuild_index = st.checkbox("Rebuild from scratch", value=False, key="rebuild_index_checkbox")
+    collection_meta = load_collection_meta(active_collection)
+    n_shards = collection_meta["n_shards"] if collection_meta else DEFAULT_N_SHARDS
+    if rebuild_index:
+        n_shards = int(st.number_input(
+            "Shards", min_value=1, max_value=64, value=n_shards, key="n_shards_input",
+            help="Splits the collection into several FAISS indexes that are rebuilt on their own and searched in parallel.",
+        ))
+    index_type_choice = st.selectbox(
+        "Search index type",
+        ["auto"] + list(INDEX_TYPES),
+        help="'auto' picks exact (flat) search for small corpora and HNSW/IVF/IVF-PQ as the chunk count grows.",
+        key="index_type_select",
+    )
+    index_type = None if index_type_choice == "auto" else index_type_choice
+    vector_storage = st.selectbox(
+        "Vector storage",
+        list(VECTOR_STORAGES),
+        help="float16 halves and int8 quarters the search index's memory, at a small cost in recall.",
+        key="vector_storage_select",
+    )
+    profile_ingest = st.checkbox(
+        "Profile ingest (cProfile + tracemalloc)", value=False, key="profile_ingest_checkbox",
+        help="Writes a .prof file to ./profiles and shows the slowest calls and peak memory below.",
+    )
 
     if uploaded_files:
         if st.button("Embed Uploaded PDFs", type="primary", key="embed_button"):
-            with st.spinner("Clearing old index and embedding new files..."):
-                clear_faiss_index()
-                file_paths = save_uploaded_files(uploaded_files)
+            spinner_text = "Clearing old index and embedding new files..." if rebuild_index else "Updating index with new files..."
+            with st.spinner(spinner_text):
+                progress_bar = st.progress(0.0, text="Preparing files...")
+
+                def show_ingest_progress(progress):
+                    files_total = max(progress["files_total"], 1)
+                    progress_bar.progress(
+                        min(progress["files_done"] / files_total, 1.0),
+                        text=(
+                            f"📄 {progress['files_done']}/{progress['files_total']} files · "
+                            f"{progress['pages']} pages · {progress['chunks']} chunks · "
+                            f"{progress['embedded']} embedded"
+                        ),
+                    )
+
                 try:
-                    success = embed_files_from_paths(file_paths)
+                    ingest_started = time.perf_counter()
+                    with profile_run("ingest", enabled=profile_ingest) as profile, trace_turn() as ingest_stages:
+                        if rebuild_index:
+                            clear_collection(active_collection)
+                            save_uploaded_files(uploaded_files, active_collection)
+                            success = embed_files_from_paths(
+                                list_uploaded_files(active_collection), progress_callback=show_ingest_progress,
+                                index_type=index_type, collection=active_collection, n_shards=n_shards,
+                                storage=vector_storage,
+                            )
+                        else:
+                            save_uploaded_files(uploaded_files, active_collection)
+                            # Incremental sync against everything stored for this collection
+                            success = embed_files_from_paths(
+                                list_uploaded_files(active_collection), incremental=True,
+                                progress_callback=show_ingest_progress, index_type=index_type,
+                                collection=active_collection, storage=vector_storage,
+                            )
+                    if profile:
+                        st.session_state.last_ingest_profile = profile
+                    get_query_log().write({
+                        "event": "ingest",
+                        "collection": active_collection,
+                        "files": len(list_uploaded_files(active_collection)),
+                        "rebuild": rebuild_index,
+                        "seconds": round(time.perf_counter() - ingest_started, 3),
+                        "stages": ingest_stages,
+                    })
                     if success:
-                        st.session_state.embedding_created = True
-                        st.session_state.qa_chain = None  # Reset chain to reload
+                        index_registry.reload(active_collection)  # Swap the new index in for every session
+                        st.session_state.embedding_created = query_collections_ready()
                         st.session_state.status_message = "✅ PDFs embedded successfully!"
                         st.rerun()
                     else:
@@ -146,14 +428,49 @@ with tab1:
                     st.session_state.embedding_created = False
                     st.session_state.status_message = f"💥 Error during embedding: {e}"
 
+    if st.session_state.get("last_ingest_profile"):
+        last_profile = st.session_state.last_ingest_profile
+        with st.expander(f"🔬 Last ingest profile (peak traced memory {last_profile['peak_memory_mb']} MB)"):
+            st.caption(f"Saved to `{last_profile['prof_path']}`")
+            st.code(last_profile["summary"])
+
+    # Removing stored files deletes their vectors from the index by chunk ID
+    stored_files = list_uploaded_files(active_collection)
+    if stored_files:
+        with st.expander(f"🗂️ Stored PDFs ({len(stored_files)})"):
+            files_to_remove = st.multiselect(
+                "Select PDF(s) to remove from the index",
+                stored_files,
+                format_func=os.path.basename,
+                key="files_to_remove",
+            )
+            if files_to_remove and st.button("Remove Selected PDFs", key="remove_files_button"):
+                with st.spinner("Removing files from the index..."):
+                    try:
+                        for path in files_to_remove:
+                            os.remove(path)
+                        embed_files_from_paths(list_uploaded_files(active_collection), incremental=True,
+                                               index_type=index_type, collection=active_collection,
+                                               storage=vector_storage)
+                        index_registry.reload(active_collection)
+                        st.session_state.embedding_created = query_collections_ready()
+                        st.session_state.status_message = f"🗑️ Removed {len(files_to_remove)} file(s) from the index."
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"💥 Error while removing files: {e}")
+
 
 # --- LOAD/RELOAD QA CHAIN ---
 # This logic runs on every rerun if conditions are met
 if st.session_state.embedding_created and st.session_state.qa_chain is None:
     st.sidebar.info("Loading QA Chain...")
     try:
-        retriever = load_faiss_index()
+        # Sessions only build their own chain (for their memory); the retriever reads the shared index
+        for collection in st.session_state.query_collections:
+            index_registry.get_state(collection)  # Surface index load errors here rather than mid-query
+        retriever = index_registry.get_retriever(k=3, collections=st.session_state.query_collections)
         st.session_state.qa_chain = get_llm_chain(retriever, st.session_state.memory)
+        st.session_state.qa_chain_collections = list(st.session_state.query_collections)
         st.sidebar.success("QA Chain Ready!")
     except Exception as e:
         st.sidebar.error(f"❌ QA chain load error: {e}")
@@ -184,6 +501,8 @@ with tab2:
                 if st.button("🛑 Stop Voice Chat", type="secondary", key="stop_chat_button", use_container_width=True):
                     st.session_state.listening_active = False
                     st.session_state.status_message = "🛑 Voice chat stopped by user."
+                    stop_speaking()
+                    stop_background_listener()
                     st.session_state.user_query_for_processing = None
                     # Optionally speak confirmation:
                     # st.session_state.speak_next_answer = "Voice chat ended."
@@ -198,76 +517,101 @@ with tab2:
         if st.session_state.speak_next_answer:
             text_to_speak = st.session_state.speak_next_answer
             st.session_state.speak_next_answer = "" # Clear after getting it
-            speak_text(text_to_speak)
+            # Only enqueues; playback runs on the TTS worker thread, which logs its timings under the turn id
+            speak_text(text_to_speak, turn_id=st.session_state.speak_turn_id)
+            st.session_state.speak_turn_id = None
             # No rerun here, let it flow to listening if active
 
         # 2. LISTENING PHASE (if active and no query is pending processing)
-        if st.session_state.listening_active and not st.session_state.user_query_for_processing and not st.session_state.speak_next_answer :
-            status_placeholder = st.empty()
-            status_placeholder.info("🎤 Listening... Say 'stop listening' or 'goodbye' to end.")
-
-            query_result = listen_query(timeout=7, phrase_time_limit=12)
-            status_placeholder.empty() # Clear "Listening..."
-
-            if query_result == LISTENING_TIMEOUT:
-                st.session_state.status_message = "⏱️ Didn't catch that. Try speaking again."
-                # Potentially speak this message too
-                # st.session_state.speak_next_answer = "I didn't catch that."
-                st.rerun()
-            elif query_result == STOP_COMMAND_RECEIVED:
-                st.session_state.listening_active = False
-                st.session_state.status_message = "🛑 Voice chat ended by command."
-                st.session_state.speak_next_answer = "Okay, ending voice chat."
-                st.rerun()
-            elif query_result and query_result.startswith(SPEECH_RECOGNITION_ERROR): # Check prefix
-                error_msg = query_result.split("::", 1)[1] if "::" in query_result else "Unknown speech error"
-                st.session_state.status_message = f"⚠️ Speech Recognition Error: {error_msg}. Try again."
-                st.session_state.chat_history.append( (f"SR Attempt Failed", f"Error: {error_msg}", []) )
-                st.session_state.speak_next_answer = f"I had a speech recognition error: {error_msg}. Please try again."
-                st.rerun()
-            elif query_result: # Valid query received
-                st.session_state.user_query_for_processing = query_result
-                st.session_state.status_message = f"✅ You said: \"{query_result}\". Processing..."
-                st.rerun() # Rerun to move to processing phase
-            else: # Should ideally not be reached if listen_query is robust
-                st.session_state.status_message = "⚠️ No query captured. Listening again..."
-                st.rerun()
+        if st.session_state.listening_active and not st.session_state.user_query_for_processing:
+            poll_voice_input()
 
 
         # 3. PROCESSING PHASE (if a query is pending and listening is still active)
         if st.session_state.user_query_for_processing and st.session_state.listening_active:
             query = st.session_state.user_query_for_processing
             st.session_state.user_query_for_processing = None # Consume the query
+            turn_id = uuid.uuid4().hex[:12]
+            # Listening and recognition ran on the listener's threads, outside trace_turn()
+            voice_timings, st.session_state.voice_timings = st.session_state.voice_timings, {}
 
             # Display user query immediately
             st.markdown(f"<div class='chat-bubble user-bubble'>You: {query}</div>", unsafe_allow_html=True)
 
+            answer_placeholder = st.empty()
             with st.spinner(f"🔍 Thinking about: \"{query}\"..."):
                 try:
-                    result = st.session_state.qa_chain.invoke({"question": query})
-                    answer = result.get("answer", "Sorry, I couldn't find an answer to that.")
-                    sources = result.get("source_documents", [])
+                    timing = None
+                    usage = None
+                    with trace_turn() as stages:  # Collects per-stage spans for this turn
+                        # Semantic answer cache: repeated questions skip retrieval and the LLM round trip.
+                        # Follow-ups that get condensed against this session's history never use it.
+                        fast_path = st.session_state.condense_fast_path
+                        cacheable = searched_as_asked(st.session_state.qa_chain, query, fast_path=fast_path)
+                        cached = None
+                        if cacheable:
+                            query_vector = index_registry.get_query_embedder().embed_query(query)
+                            index_version = index_registry.version_key(st.session_state.qa_chain_collections)
+                            cached = index_registry.answer_cache.lookup(query_vector, index_version, query)
+                        if cached:
+                            answer, sources = cached
+                            st.session_state.memory.save_context({"question": query}, {"answer": answer})
+                        else:
+                            # Stream tokens into the bot bubble as they arrive; sources come with the final event
+                            partial_answer = ""
+                            for event, payload in stream_answer(st.session_state.qa_chain, query, fast_path=fast_path):
+                                if event == "token":
+                                    partial_answer += payload
+                                    answer_placeholder.markdown(
+                                        f"<div class='chat-bubble bot-bubble'>Bot: {partial_answer}▌</div>",
+                                        unsafe_allow_html=True,
+                                    )
+                                else:
+                                    answer = payload["answer"] or "Sorry, I couldn't find an answer to that."
+                                    sources = payload["source_documents"]
+                                    timing = payload["timing"]
+                                    usage = payload["usage"]
+                                    st.session_state.turn_timings.append(timing)
+                                    for key, value in usage.items():
+                                        st.session_state.usage_totals[key] += value
+                            if cacheable:
+                                index_registry.answer_cache.store(query_vector, answer, sources, index_version, query)
 
                     st.session_state.chat_history.append((query, answer, sources))
                     st.session_state.speak_next_answer = answer # Queue answer for speaking
+                    st.session_state.speak_turn_id = turn_id
                     st.session_state.status_message = f"💡 Answer found for \"{query}\". Preparing to listen for next query..."
 
                     # Display bot answer
-                    st.markdown(f"<div class='chat-bubble bot-bubble'>Bot: {answer}</div>", unsafe_allow_html=True)
+                    answer_placeholder.markdown(f"<div class='chat-bubble bot-bubble'>Bot: {answer}</div>", unsafe_allow_html=True)
 
-                    # Log to file
-                    try:
-                        with open("chat_log.txt", "a", encoding="utf-8") as f:
-                            f.write(f"\n\n[{datetime.now()}]\nQ: {query}\nA: {answer}\n")
-                    except Exception as log_e:
-                        st.warning(f"Could not write to chat_log.txt: {log_e}")
+                    # Structured log; written by a background thread, so this never touches the disk
+                    get_query_log().write({
+                        "event": "turn",
+                        "turn_id": turn_id,  # The TTS worker logs this turn's speech under the same id
+                        "query": query,
+                        "collections": st.session_state.qa_chain_collections,
+                        "answer": answer,
+                        "answer_cache_hit": bool(cached),
+                        "sources": [
+                            {"collection": doc.metadata.get("collection"), "source": doc.metadata.get("source"),
+                             "page": doc.metadata.get("page")}
+                            for doc in sources
+                        ],
+                        "stages": {**voice_timings, **stages},
+                        "timing": timing,
+                        "usage": usage,
+                    })
 
                 except Exception as e:
                     st.error(f"💥 Error during answer generation: {e}")
                     answer = f"Sorry, an error occurred while processing your question: {str(e)[:100]}"
                     st.session_state.chat_history.append((query, answer, []))
                     st.session_state.speak_next_answer = answer # Queue error message for speaking
+                    st.session_state.speak_turn_id = turn_id
                     st.session_state.status_message = f"💥 Error processing \"{query}\". Listening again."
+                    get_query_log().write({"event": "turn_error", "turn_id": turn_id, "query": query,
+                                           "stages": voice_timings, "error": str(e)})
 
             st.rerun() # Rerun to speak the answer and then listen again
 
@@ -288,7 +632,9 @@ with tab3:
                         with st.container(border=True):
                             source_name = doc.metadata.get('source', 'Unknown Source')
                             page_num = doc.metadata.get('page', 'N/A')
-                            st.markdown(f"**File:** `{os.path.basename(source_name)}` (Page: {page_num})")
+                            collection_name = doc.metadata.get('collection')
+                            collection_label = f" · Collection: `{collection_name}`" if collection_name else ""
+                            st.markdown(f"**File:** `{os.path.basename(source_name)}` (Page: {page_num}){collection_label}")
                             st.caption(doc.page_content[:350] + "...")
     else:
         st.info("💡 No chat history yet. Upload a PDF and start a voice chat in Tab 2.")
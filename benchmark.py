@@ -0,0 +1,322 @@
+"""
+End-to-end benchmark: synthetic PDF corpus -> ingest -> index load -> retrieval -> QA turns.
+
+Runs fully offline: PDFs are generated with PyMuPDF and the LLM is the deterministic
+fake from generation.get_fake_llm(), so numbers reflect our code, not Mistral's latency.
+Each corpus size runs in its own scratch directory (DB_DIR, UPLOAD_DIR and the embedding
+cache are relative paths) and is ingested into the default collection, optionally split
+into --shards shards. Results are written as JSON for comparing runs over time.
+
+Each run also reports encoder throughput (chunks/s) at every --encoder-workers count,
+with and without length bucketing, and recall@10 / index size of every --storages
+vector storage against exact float32 search.
+
+    python benchmark.py --sizes 10,50 --pages 5 --ks 3,10 --queries 100 --turns 20 --shards 4
+    python benchmark.py --sizes 200 --encoder-workers 1,2,4,8 --encoder-threads 2 --storages float32,float16,int8
+"""
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import fitz  # PyMuPDF
+import numpy as np
+
+
+WORDS = (
+    "pavement drainage asphalt concrete friction skid surface texture aggregate wet weather "
+    "crash reduction program safety evaluation guideline chapter section design traffic volume "
+    "maintenance inspection refund policy warranty contract clause supplier invoice delivery "
+    "schedule budget approval committee report annual review compliance standard requirement"
+).split()
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"{rng.choice('ABCDX')}-{rng.randint(100, 999)}.{rng.randint(1, 9)}")
+    return " ".join(words).capitalize() + "."
+
+def make_synthetic_pdfs(out_dir, n_files, pages_per_file, seed=0):
+    """Writes n_files PDFs of pages_per_file pages of pseudo-random technical prose."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_files):
+        doc = fitz.open()
+        for _ in range(pages_per_file):
+            page = doc.new_page()
+            text = " ".join(_sentence(rng) for _ in range(rng.randint(25, 40)))
+            page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+        path = os.path.join(out_dir, f"synthetic_{i:05d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+def make_queries(n_queries, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) for _ in range(n_queries)]
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+def dir_size_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def bench_encoder(texts, args):
+    """chunks/s of a fresh ParallelEncoder per worker count; the largest count also runs unbucketed."""
+    from encoder import ParallelEncoder
+    from embeddings import EMBEDDING_MODEL_NAME
+
+    results = []
+    runs = [(workers, True) for workers in args.encoder_workers] + [(max(args.encoder_workers), False)]
+    for workers, bucketed in runs:
+        encoder = ParallelEncoder(EMBEDDING_MODEL_NAME, workers=workers, threads_per_worker=args.encoder_threads,
+                                  bucket_by_length=bucketed)
+        try:
+            encoder.embed_documents(texts[:workers * encoder.batch_size])  # Start workers and load the model
+            started = time.perf_counter()
+            encoder.embed_documents(texts)
+            seconds = time.perf_counter() - started
+        finally:
+            encoder.close()
+        results.append({
+            "workers": workers,
+            "threads_per_worker": args.encoder_threads,
+            "length_bucketed": bucketed,
+            "chunks": len(texts),
+            "seconds": round(seconds, 3),
+            "chunks_per_s": round(len(texts) / seconds, 2),
+        })
+        print(f"  🧮 {workers} worker(s) x {args.encoder_threads} thread(s){'' if bucketed else ', unbucketed'}: "
+              f"{results[-1]['chunks_per_s']:.1f} chunks/s")
+    return results
+
+def bench_quantization(vectors, query_vectors, args):
+    """recall@k against exact float32 search, index size and search latency per index type and storage."""
+    import faiss
+    from ann_index import RECALL_K, _min_vectors, apply_search_params, build_index, choose_index_type, \
+        index_nbytes, recall_at_k
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    flat_bytes = index_nbytes(exact_index)
+    ann_type = args.index_type or choose_index_type(len(vectors))
+    index_types = ["flat"] if ann_type == "flat" else ["flat", ann_type]
+    results = []
+    for index_type in index_types:
+        if len(vectors) < _min_vectors(index_type):
+            continue
+        for storage in args.storages:
+            index, params = build_index(vectors, index_type, storage)
+            apply_search_params(index)
+            started = time.perf_counter()
+            index.search(query_vectors, RECALL_K)
+            search_s = time.perf_counter() - started
+            results.append({
+                "index_type": index_type,
+                **params,
+                f"recall_at_{RECALL_K}": round(recall_at_k(index, exact_index, query_vectors), 4),
+                "index_bytes": index_nbytes(index),
+                "bytes_vs_flat_float32": round(index_nbytes(index) / flat_bytes, 3),
+                "search_ms_per_query": round(search_s * 1000 / len(query_vectors), 4),
+            })
+    return results
+
+
+def bench_corpus(n_files, args):
+    # Imported lazily so the scratch directory is the working directory for relative paths
+    from conversation_memory import make_memory
+    import embeddings
+    from registry import IndexRegistry
+    from generation import get_llm_chain, get_fake_llm, stream_answer
+
+    result = {"n_files": n_files, "pages_per_file": args.pages, "shards": args.shards}
+    upload_dir = embeddings.collection_upload_dir()  # Relative to this run's scratch directory
+
+    started = time.perf_counter()
+    paths = make_synthetic_pdfs(upload_dir, n_files, args.pages, seed=n_files)
+    result["pdf_generation_s"] = round(time.perf_counter() - started, 3)
+
+    # --- INGEST ---
+    # Spawning the encoder workers and loading the model in each is a one-off per process; keep
+    # it out of the first corpus size's ingest time
+    from encoder import get_encoder
+    encoder = get_encoder(embeddings.EMBEDDING_MODEL_NAME)
+    started = time.perf_counter()
+    encoder.embed_documents(["warm-up"] * (encoder.workers * encoder.batch_size))
+    result["encoder_warmup_s"] = round(time.perf_counter() - started, 3)
+
+    progress = {}
+    started = time.perf_counter()
+    embeddings.embed_files_from_paths(paths, progress_callback=progress.update, index_type=args.index_type,
+                                      n_shards=args.shards, storage=args.storages[0])
+    ingest_s = time.perf_counter() - started
+    result["ingest"] = {
+        "seconds": round(ingest_s, 3),
+        "pages": progress.get("pages", 0),
+        "chunks": progress.get("chunks", 0),
+        "pages_per_s": round(progress.get("pages", 0) / ingest_s, 2),
+        "chunks_per_s": round(progress.get("chunks", 0) / ingest_s, 2),
+    }
+
+    # Search-index build on its own, from the exact index of each shard written by ingest
+    import faiss
+    from ann_index import build_ann_from_flat
+    result["index_build"] = []
+    # Recall is measured with real query embeddings rather than vectors taken from the index
+    recall_queries = np.asarray(embeddings.get_embedding_model().embed_documents(make_queries(args.queries)),
+                                dtype=np.float32)
+    for shard_dir in embeddings.collection_shard_dirs():
+        exact_index = faiss.read_index(os.path.join(shard_dir, "index.faiss"))
+        started = time.perf_counter()
+        ann_meta = build_ann_from_flat(exact_index, index_type=args.index_type, db_dir=shard_dir,
+                                       storage=args.storages[0], queries=recall_queries)
+        result["index_build"].append({"seconds": round(time.perf_counter() - started, 3), **ann_meta})
+    result["index_size_bytes"] = dir_size_bytes(embeddings.collection_dir())
+
+    # --- ENCODER SCALING & QUANTIZATION ---
+    from chunk_store import CHUNK_STORE_FILE, ChunkStore
+    texts, shard_vectors = [], []
+    for shard_dir in embeddings.collection_shard_dirs():
+        store = ChunkStore(os.path.join(shard_dir, CHUNK_STORE_FILE))
+        texts.extend(text for _, text in store.iter_texts())
+        store.close()
+        exact_index = faiss.read_index(os.path.join(shard_dir, "index.faiss"))
+        shard_vectors.append(exact_index.reconstruct_n(0, exact_index.ntotal))
+    result["encoder_scaling"] = bench_encoder(texts[:args.encoder_chunks], args)
+
+    # --- STARTUP ---
+    registry = IndexRegistry()
+    started = time.perf_counter()
+    registry.get_state()
+    result["load_faiss_index_s"] = round(time.perf_counter() - started, 4)
+
+    # --- RETRIEVAL ---
+    # Query embedding is timed on the bare model and reported on its own: going through the
+    # registry's query-embedding LRU, every query after the first pass would be a cache hit
+    queries = make_queries(args.queries)
+    model = embeddings.get_embedding_model()
+    model.embed_query(queries[0])  # Warm-up
+    query_vectors, embed_timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        query_vectors.append(model.embed_query(query))
+        embed_timings.append(time.perf_counter() - started)
+    result["query_embed"] = latency_summary(embed_timings)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    result["quantization"] = bench_quantization(np.concatenate(shard_vectors), query_vectors, args)
+    # Search only (FAISS, BM25, fusion, chunk reads); add query_embed for a retriever call
+    result["retrieval"] = {}
+    for mode in ("dense", "hybrid"):
+        for k in args.ks:
+            hybrid = mode == "hybrid"
+            registry.search(queries[0], query_vectors[0], k=k, hybrid=hybrid)  # Warm-up
+            timings = []
+            for query, query_vector in zip(queries, query_vectors):
+                started = time.perf_counter()
+                registry.search(query, query_vector, k=k, hybrid=hybrid)
+                timings.append(time.perf_counter() - started)
+            result["retrieval"][f"{mode}_k{k}"] = latency_summary(timings)
+
+    # --- END-TO-END TURNS (fake LLM) ---
+    memory = make_memory(args.memory_mode)
+    chain = get_llm_chain(registry.get_retriever(k=3), memory, llm=get_fake_llm())
+    invoke_timings, ttfts, stream_totals = [], [], []
+    usage = {"llm_calls": 0, "prompt_tokens": 0, "saved_llm_calls": 0, "saved_prompt_tokens": 0}
+    for query in queries[:args.turns]:
+        started = time.perf_counter()
+        chain.invoke({"question": query})
+        invoke_timings.append(time.perf_counter() - started)
+    memory.clear()
+    for query in queries[:args.turns]:
+        for event, payload in stream_answer(chain, query):
+            if event == "done":
+                ttfts.append(payload["timing"]["ttft"])
+                stream_totals.append(payload["timing"]["total"])
+                for key, value in payload["usage"].items():
+                    usage[key] += value
+    result["e2e"] = {
+        "invoke": latency_summary(invoke_timings),
+        "stream_ttft": latency_summary(ttfts),
+        "stream_total": latency_summary(stream_totals),
+        "stream_usage": usage,
+    }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,50", help="Comma-separated corpus sizes (number of PDFs)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic PDF")
+    parser.add_argument("--ks", default="3,10", help="Comma-separated k values for retrieval latency")
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval queries per k")
+    parser.add_argument("--turns", type=int, default=20, help="End-to-end chain turns")
+    parser.add_argument("--index-type", default=None, help="Force a search index type (default: auto)")
+    parser.add_argument("--shards", type=int, default=1, help="FAISS shards per corpus (searched in parallel)")
+    parser.add_argument("--memory-mode", default="budgeted", help="Chat memory for the end-to-end turns (budgeted/buffer)")
+    parser.add_argument("--encoder-workers", default="1,2,4", help="Comma-separated encoder process counts")
+    parser.add_argument("--encoder-threads", type=int, default=2, help="Torch threads per encoder process")
+    parser.add_argument("--encoder-chunks", type=int, default=2000, help="Chunks encoded per worker count")
+    parser.add_argument("--storages", default="float32,float16,int8",
+                        help="Comma-separated vector storages to compare; the first is used for ingest")
+    parser.add_argument("--out", default="./bench_results", help="Directory for the JSON results")
+    args = parser.parse_args(argv)
+    args.ks = [int(k) for k in args.ks.split(",")]
+    args.encoder_workers = [int(w) for w in args.encoder_workers.split(",")]
+    args.storages = args.storages.split(",")
+
+    out_dir = os.path.abspath(args.out)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "runs": [],
+    }
+
+    original_cwd = os.getcwd()
+    for n_files in [int(n) for n in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory(prefix=f"rag_bench_{n_files}_") as work_dir:
+            os.chdir(work_dir)
+            try:
+                print(f"📊 Benchmarking {n_files} PDFs x {args.pages} pages in {work_dir}")
+                report["runs"].append(bench_corpus(n_files, args))
+            finally:
+                os.chdir(original_cwd)
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {out_path}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
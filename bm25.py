@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+
+BM25_DIR = "bm25"  # Lives in each shard directory, next to index.faiss
+BM25_META_FILE = "meta.json"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more than this share of chunks ("the", "of") are skipped at query time: their IDF
+# is close to zero, yet their postings would dominate the cost of the query
+MAX_DF_RATIO = 0.5
+
+# Keeps part numbers and clause IDs ("A-113.2", "iso/iec-27001") whole, and also indexes their pieces
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./_][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+
+def term_hash(term):
+    # Stable across processes (unlike hash()); 64 bits make collisions negligible for any vocabulary
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Compact inverted index with BM25 weights precomputed per posting.
+
+    Postings are stored CSR-style: the postings of term t are doc_ids[offsets[t]:offsets[t+1]]
+    with matching weights, where doc IDs are FAISS vector positions. A query is then just a
+    few array slices, one bincount and one argpartition. The vocabulary is a sorted array of
+    64-bit term hashes (with the term ID of each), looked up by binary search. Every array is
+    saved as a .npy file and memory-mapped on load, so loading costs the same for any corpus size.
+    """
+
+    def __init__(self, term_hashes, term_ids, offsets, doc_ids, weights, n_docs):
+        self.term_hashes = term_hashes
+        self.term_ids = term_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B):
+        """texts: iterable of (position, text) with positions 0..N-1, as yielded by ChunkStore.iter_texts()."""
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = []
+        for position, text in texts:
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                term_id = vocab.setdefault(token, len(vocab))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            term_ids.extend(counts.keys())
+            doc_ids.extend([position] * len(counts))
+            tfs.extend(counts.values())
+
+        n_docs = len(doc_lengths)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+
+        # Group postings by term
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        doc_freq = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(doc_freq)
+        df = doc_freq.astype(np.float32)
+
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avg_length = doc_lengths.mean() if n_docs else 0.0
+        norm = k1 * (1 - b + b * doc_lengths[doc_ids] / max(avg_length, 1e-9))
+        weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        term_hashes, vocab_ids = cls._hash_vocab(vocab)
+        return cls(term_hashes, vocab_ids, offsets, doc_ids, weights, n_docs)
+
+    @staticmethod
+    def _hash_vocab(vocab):
+        # {term: term_id} -> (sorted term hashes, term_id of each)
+        hashes = np.fromiter((term_hash(t) for t in vocab), dtype=np.uint64, count=len(vocab))
+        ids = np.fromiter(vocab.values(), dtype=np.int64, count=len(vocab))
+        order = np.argsort(hashes)
+        return hashes[order], ids[order]
+
+    def _lookup(self, terms):
+        if not terms or not len(self.term_hashes):
+            return []
+        hashes = np.fromiter((term_hash(t) for t in terms), dtype=np.uint64, count=len(terms))
+        rows = np.minimum(np.searchsorted(self.term_hashes, hashes), len(self.term_hashes) - 1)
+        return [int(t) for t in self.term_ids[rows[self.term_hashes[rows] == hashes]]]
+
+    def search(self, query, k=10):
+        """Returns up to k (position, score) pairs, best first."""
+        term_ids = self._lookup(list(dict.fromkeys(tokenize(query))))
+        if not term_ids:
+            return []
+        slices = [slice(int(self.offsets[t]), int(self.offsets[t + 1])) for t in term_ids]
+        common = max(1.0, MAX_DF_RATIO * self.n_docs)
+        rare = [s for s in slices if s.stop - s.start <= common]
+        # A query made only of common terms still searches its rarest one
+        slices = rare or [min(slices, key=lambda s: s.stop - s.start)]
+        hit_docs = np.concatenate([self.doc_ids[s] for s in slices])
+        hit_weights = np.concatenate([self.weights[s] for s in slices])
+
+        if len(hit_docs) * 8 < self.n_docs:
+            # Few hits: sorting them is cheaper than touching an array over every document
+            docs, inverse = np.unique(hit_docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=hit_weights)
+        else:
+            # Many hits: a dense accumulator over all documents avoids sorting them.
+            # BM25 weights are always positive, so a zero score means the document did not match.
+            docs = None
+            scores = np.bincount(hit_docs, weights=hit_weights, minlength=self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[scores[top] > 0]
+        top = top[np.argsort(-scores[top])]
+        positions = top if docs is None else docs[top]
+        return [(int(p), float(scores[i])) for p, i in zip(positions, top)]
+
+    def save(self, db_dir):
+        out_dir = os.path.join(db_dir, BM25_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        # Write-then-rename: a loaded index may still have the old files memory-mapped
+        arrays = (("term_hashes", self.term_hashes), ("term_ids", self.term_ids), ("offsets", self.offsets),
+                  ("doc_ids", self.doc_ids), ("weights", self.weights))
+        for name, array in arrays:
+            path = os.path.join(out_dir, f"{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        # Written last: load() only trusts a directory that has it
+        meta_path = os.path.join(out_dir, BM25_META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(cls, db_dir):
+        in_dir = os.path.join(db_dir, BM25_DIR)
+
+        def array(name):
+            return np.load(os.path.join(in_dir, f"{name}.npy"), mmap_mode="r")
+
+        meta_path = os.path.join(in_dir, BM25_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(array("term_hashes"), array("term_ids"), array("offsets"), array("doc_ids"), array("weights"),
+                   meta["n_docs"])
@@ -0,0 +1,162 @@
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+
+CHUNK_STORE_FILE = "chunks.sqlite"  # Lives in each shard directory, replaces LangChain's pickled index.pkl
+
+
+class ChunkStore:
+    """
+    On-disk chunk text and metadata, keyed by FAISS vector position and by chunk ID.
+
+    Searches only read the rows for the k positions FAISS returns, so opening the store
+    costs the same whether it holds a hundred chunks or a million.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return count
+
+    def id_at(self, position):
+        with self._lock:
+            row = self._db.execute("SELECT id FROM chunks WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def get(self, chunk_id):
+        with self._lock:
+            row = self._db.execute("SELECT text, metadata FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+        if row is None:
+            return None
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def iter_positions(self):
+        with self._lock:
+            positions = [p for (p,) in self._db.execute("SELECT position FROM chunks ORDER BY position")]
+        return iter(positions)
+
+    def iter_texts(self, batch_size=10_000):
+        # Streams (position, text) in FAISS order without loading the whole store
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT position, text FROM chunks WHERE position > ? ORDER BY position LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ChunkStoreWriter:
+    """
+    Writes a shard's next chunk store to path + ".tmp", batch by batch, and swaps it in on commit().
+
+    With copy_from, the rows of an existing store are copied over inside SQLite, minus
+    drop_ids, and renumbered 0..N-1 in their old order, which is how FAISS remove_ids()
+    compacts the index; dropped_positions holds the old positions to pass it. Chunks are
+    never collected in Python, so an ingest holds one embedding batch of text at a time.
+    """
+
+    def __init__(self, path, copy_from=None, drop_ids=()):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._db = sqlite3.connect(self._tmp_path)
+        self._db.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "text TEXT NOT NULL, source TEXT, page INTEGER, metadata TEXT NOT NULL)"
+        )
+        self.dropped_positions = []
+        if copy_from is not None:
+            self._copy(copy_from, drop_ids)
+        (self._count,) = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()
+
+    def _copy(self, source_path, drop_ids):
+        db = self._db
+        db.execute("CREATE TEMP TABLE dropped (id TEXT PRIMARY KEY)")
+        db.executemany("INSERT OR IGNORE INTO dropped VALUES (?)", ((i,) for i in drop_ids))
+        db.execute("ATTACH DATABASE ? AS old", (source_path,))
+        self.dropped_positions = [p for (p,) in db.execute(
+            "SELECT position FROM old.chunks WHERE id IN (SELECT id FROM dropped) ORDER BY position")]
+        with db:
+            db.execute(
+                "INSERT INTO chunks SELECT ROW_NUMBER() OVER (ORDER BY position) - 1, id, text, source, page, "
+                "metadata FROM old.chunks WHERE id NOT IN (SELECT id FROM dropped)"
+            )
+        db.execute("DETACH DATABASE old")
+
+    def __len__(self):
+        return self._count
+
+    def add(self, ids, docs):
+        """Appends chunks at the next positions, i.e. in the order their vectors were added to FAISS."""
+        rows = [
+            (self._count + i, chunk_id, doc.page_content, doc.metadata.get("source"), doc.metadata.get("page"),
+             json.dumps(doc.metadata, default=str))
+            for i, (chunk_id, doc) in enumerate(zip(ids, docs))
+        ]
+        with self._db:
+            self._db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._count += len(rows)
+
+    def commit(self):
+        self._db.close()
+        os.replace(self._tmp_path, self.path)  # Readers keep the old file open until they reload
+
+    def abort(self):
+        self._db.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class LazyDocstore(Docstore):
+    """Read-only LangChain docstore that fetches chunks from a ChunkStore on demand."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def search(self, search):
+        doc = self.store.get(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts):
+        raise NotImplementedError("LazyDocstore is read-only; update the index through embed_files_from_paths.")
+
+    def delete(self, ids):
+        raise NotImplementedError("LazyDocstore is read-only; update the index through embed_files_from_paths.")
+
+
+class LazyIndexToDocstoreId(Mapping):
+    """FAISS vector position -> chunk ID, looked up in the ChunkStore instead of held in RAM."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, position):
+        return self.store.id_at(position)
+
+    def __iter__(self):
+        return self.store.iter_positions()
+
+    def __len__(self):
+        return len(self.store)
@@ -0,0 +1,114 @@
+import re
+from typing import Any, Dict, List
+from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+
+
+MEMORY_MODES = ("budgeted", "buffer")
+MEMORY_WINDOW_TURNS = 4  # Most recent question/answer pairs kept verbatim
+MEMORY_TOKEN_BUDGET = 800  # Cap on window + summary, in estimated tokens
+SUMMARY_TOKEN_BUDGET = 200
+CHARS_PER_TOKEN = 4  # Rough English average; avoids a tokenizer dependency for budgeting
+MIN_STANDALONE_WORDS = 4
+
+# Words that usually point back at an earlier turn ("what does it cost?", "and the other one?")
+_ANAPHORA = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers", "there", "one", "ones", "former", "latter",
+    "above", "previous", "earlier", "same", "else", "also", "too", "again", "more",
+}
+_FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "or ", "what about", "how about", "then ", "why not")
+_WORD_RE = re.compile(r"[a-z']+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def is_self_contained(question):
+    """
+    True when a question can be searched as is, without condensing it against the chat
+    history. Deliberately conservative: any pronoun or follow-up opener sends the question
+    through the condense step.
+    """
+    text = question.lower().strip()
+    words = _WORD_RE.findall(text)
+    if len(words) < MIN_STANDALONE_WORDS or text.startswith(_FOLLOW_UP_OPENERS):
+        return False
+    return not any(word in _ANAPHORA for word in words)
+
+
+class BudgetedConversationMemory(BaseChatMemory):
+    """
+    Chat memory that keeps the last max_turns turns verbatim plus a running summary of
+    older turns, within max_tokens overall.
+
+    Turns that fall out of the window are folded into the summary extractively (question
+    plus the first sentence of the answer) rather than by an LLM call, and the oldest
+    summary lines are dropped once it exceeds summary_max_tokens. unbounded_tokens tracks
+    what a ConversationBufferMemory would be carrying, so callers can report the savings.
+    """
+
+    memory_key: str = "chat_history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    max_turns: int = MEMORY_WINDOW_TURNS
+    max_tokens: int = MEMORY_TOKEN_BUDGET
+    summary_max_tokens: int = SUMMARY_TOKEN_BUDGET
+    summary: str = ""
+    unbounded_tokens: int = 0
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = list(self.chat_memory.messages)
+        if self.summary:
+            messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.unbounded_tokens += estimate_tokens(input_str) + estimate_tokens(output_str)
+        self.prune()
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(m.content) for m in self.chat_memory.messages)
+
+    def prune(self):
+        # Always keeps the latest turn, even if it alone is over budget
+        messages = self.chat_memory.messages
+        while len(messages) > 2 and (len(messages) > 2 * self.max_turns or self.history_tokens() > self.max_tokens):
+            self._fold_into_summary(messages[0].content, messages[1].content)
+            self.chat_memory.messages = messages = messages[2:]
+
+    def _fold_into_summary(self, question, answer):
+        first_sentence = _SENTENCE_END_RE.split(answer.strip(), maxsplit=1)[0]
+        lines = (self.summary.split("\n") if self.summary else []) + [f"- Q: {question} A: {first_sentence}"]
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        self.summary = "\n".join(lines)[: self.summary_max_tokens * CHARS_PER_TOKEN]
+
+    def clear(self) -> None:
+        super().clear()
+        self.summary = ""
+        self.unbounded_tokens = 0
+
+
+def make_memory(mode="budgeted", messages=None):
+    """Chat memory for get_llm_chain; messages carries an existing conversation over when switching modes."""
+    if mode not in MEMORY_MODES:
+        raise ValueError(f"Unknown memory mode '{mode}'. Expected one of {MEMORY_MODES}.")
+    memory_cls = BudgetedConversationMemory if mode == "budgeted" else ConversationBufferMemory
+    memory = memory_cls(memory_key="chat_history", return_messages=True, output_key="answer")
+    if messages:
+        memory.chat_memory.add_messages([m for m in messages if not isinstance(m, SystemMessage)])
+        if isinstance(memory, BudgetedConversationMemory):
+            memory.unbounded_tokens = sum(estimate_tokens(m.content) for m in memory.chat_memory.messages)
+            memory.prune()
+    return memory
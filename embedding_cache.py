@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_CACHE_DIR = "./embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+EVICT_TO_FRACTION = 0.8  # On overflow, keep this fraction of the cap (most recently used first)
+
+VECTORS_FILE = "vectors.f32"
+INDEX_FILE = "index.sqlite"
+META_FILE = "meta.json"
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedder with a persistent chunk-hash -> vector cache.
+
+    Vectors are appended to a raw float32 file that is read back through a memory map;
+    a small SQLite table maps each text hash to its row and last-use time. The cache is
+    tied to the model name and chunk parameters recorded in meta.json and is wiped if
+    either changes. When it grows past max_entries the least recently used rows are
+    dropped and the vector file is compacted.
+
+    Only embed_documents is cached; embed_query goes straight to the wrapped model.
+    """
+
+    def __init__(self, embedder, model_name, chunk_size, chunk_overlap,
+                 cache_dir=EMBEDDING_CACHE_DIR, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embedder = embedder
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._meta = {"model_name": model_name, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        self._vectors = None  # Memory map over VECTORS_FILE, reopened when the file grows
+        self._open()
+
+    # --- STORAGE ---
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _open(self):
+        meta_path = self._path(META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                stored_meta = json.load(f)
+            if any(stored_meta.get(key) != value for key, value in self._meta.items()):
+                print(f"♻️ Embedding cache was built with {stored_meta}, now {self._meta}; clearing it.")
+                shutil.rmtree(self.cache_dir)
+            else:
+                self._meta["dim"] = stored_meta.get("dim")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(self._path(INDEX_FILE), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._meta, f, indent=2)
+
+    def _n_rows(self):
+        dim = self._meta.get("dim")
+        vectors_path = self._path(VECTORS_FILE)
+        if not dim or not os.path.exists(vectors_path):
+            return 0
+        return os.path.getsize(vectors_path) // (4 * dim)
+
+    def _read_rows(self, rows):
+        n_rows = self._n_rows()
+        if self._vectors is None or self._vectors.shape[0] != n_rows:
+            self._vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r",
+                                      shape=(n_rows, self._meta["dim"]))
+        return np.asarray(self._vectors[rows])
+
+    def _append_rows(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not self._meta.get("dim"):
+            self._meta["dim"] = int(vectors.shape[1])
+            self._write_meta()
+        first_row = self._n_rows()
+        with open(self._path(VECTORS_FILE), "ab") as f:
+            f.write(vectors.tobytes())
+        return range(first_row, first_row + len(vectors))
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count <= self.max_entries:
+            return
+        keep = int(self.max_entries * EVICT_TO_FRACTION)
+        kept = self._db.execute(
+            "SELECT hash, row FROM entries ORDER BY last_used DESC LIMIT ?", (keep,)
+        ).fetchall()
+        kept_vectors = self._read_rows([row for _, row in kept]) if kept else np.empty((0, self._meta["dim"]), np.float32)
+
+        # Compact into a fresh file, then swap it in
+        self._vectors = None
+        tmp_path = self._path(VECTORS_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(np.ascontiguousarray(kept_vectors, dtype=np.float32).tobytes())
+        os.replace(tmp_path, self._path(VECTORS_FILE))
+        with self._db:
+            self._db.execute("CREATE TEMP TABLE kept (hash TEXT PRIMARY KEY, row INTEGER)")
+            self._db.executemany("INSERT INTO kept VALUES (?, ?)", [(h, i) for i, (h, _) in enumerate(kept)])
+            self._db.execute("DELETE FROM entries WHERE hash NOT IN (SELECT hash FROM kept)")
+            self._db.execute("UPDATE entries SET row = (SELECT row FROM kept WHERE kept.hash = entries.hash)")
+            self._db.execute("DROP TABLE kept")
+        print(f"🧹 Embedding cache evicted {count - len(kept)} entries (kept {len(kept)}).")
+
+    # --- EMBEDDINGS INTERFACE ---
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        hashes = [text_sha256(text) for text in texts]
+        now = time.time()
+        with self._lock:
+            found = {}
+            unique_hashes = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique_hashes), 900):  # Stay under SQLite's variable limit
+                part = unique_hashes[start:start + 900]
+                placeholders = ",".join("?" * len(part))
+                found.update(self._db.execute(
+                    f"SELECT hash, row FROM entries WHERE hash IN ({placeholders})", part
+                ).fetchall())
+
+            missing = {}
+            for text, digest in zip(texts, hashes):
+                if digest not in found and digest not in missing:
+                    missing[digest] = text
+            self.hits += len(texts) - sum(1 for digest in hashes if digest in missing)
+            self.misses += sum(1 for digest in hashes if digest in missing)
+
+            if missing:
+                new_vectors = np.asarray(self.embedder.embed_documents(list(missing.values())), dtype=np.float32)
+                new_rows = self._append_rows(new_vectors)
+                found.update(zip(missing.keys(), new_rows))
+
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO entries (hash, row, last_used) VALUES (?, ?, ?) "
+                    "ON CONFLICT(hash) DO UPDATE SET last_used = excluded.last_used",
+                    [(digest, int(found[digest]), now) for digest in found],
+                )
+            vectors = self._read_rows([int(found[digest]) for digest in hashes])
+            self._evict()
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._db.close()
@@ -1,46 +1,516 @@
 import os
+import json
 import shutil
+import re
+import hashlib
+import time
+import threading
+import multiprocessing
+import faiss
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from embedding_cache import CachedEmbeddings
+from ann_index import VECTOR_STORAGE, build_ann_from_flat, load_search_index, write_index_atomic
+from encoder import ENCODE_BATCH_SIZE, ENCODER_THREADS_PER_WORKER, ENCODER_WORKERS, get_encoder
+from chunk_store import CHUNK_STORE_FILE, ChunkStore, ChunkStoreWriter, LazyDocstore, LazyIndexToDocstoreId
+from bm25 import BM25_DIR, BM25Index
+import telemetry
 
 
-UPLOAD_DIR = "./uploaded_pdfs"
-DB_DIR = "./faiss_index"
+UPLOAD_DIR = "./uploaded_pdfs"  # One subdirectory of PDFs per collection
+DB_DIR = "./faiss_index"  # One subdirectory per collection, holding one directory per shard
+MANIFEST_FILE = "manifest.json"  # Lives inside each shard directory, next to index.faiss / chunks.sqlite
+COLLECTION_META_FILE = "collection.json"  # {"n_shards": N}, inside the collection directory
+DEFAULT_COLLECTION = "default"
+DEFAULT_N_SHARDS = 1
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+# Parsing gets the cores the encoder pool (encoder.py) does not use
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - ENCODER_WORKERS * ENCODER_THREADS_PER_WORKER)
+MAX_INFLIGHT_FILES = INGEST_WORKERS * 2  # Bounds how many parsed files can wait in memory
+# Chunks handed to the encoder at once: enough for several batches per encoder worker, so
+# none sit idle and length bucketing has more chunks to sort
+EMBED_BATCH_SIZE = max(256, ENCODER_WORKERS * ENCODE_BATCH_SIZE * 4)
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ANN_INDEX_TYPE = None  # None = pick flat/hnsw/ivf_flat/ivf_pq from the chunk count (see ann_index.py)
+
+_COLLECTION_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+# --- COLLECTIONS & SHARDS ---
+# ./faiss_index/<collection>/collection.json
+# ./faiss_index/<collection>/shard_000/{index.faiss, chunks.sqlite, bm25/, ann.faiss, manifest.json}
+# ./uploaded_pdfs/<collection>/*.pdf
+# Files are assigned to a shard by content hash, so each shard can be rebuilt and loaded on its own.
+
+def validate_collection_name(collection):
+    if not _COLLECTION_NAME_RE.match(collection or ""):
+        raise ValueError(
+            f"Invalid collection name '{collection}': use letters, digits, '-' and '_' (max 64 characters)."
+        )
+    return collection
+
+def collection_dir(collection=DEFAULT_COLLECTION):
+    return os.path.join(DB_DIR, validate_collection_name(collection))
+
+def collection_upload_dir(collection=DEFAULT_COLLECTION):
+    return os.path.join(UPLOAD_DIR, validate_collection_name(collection))
+
+def shard_dir(collection, shard):
+    return os.path.join(collection_dir(collection), f"shard_{shard:03d}")
+
+def shard_for_digest(digest, n_shards):
+    return int(digest[:8], 16) % n_shards
+
+def load_collection_meta(collection=DEFAULT_COLLECTION):
+    meta_path = os.path.join(collection_dir(collection), COLLECTION_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_collection_meta(collection, meta):
+    os.makedirs(collection_dir(collection), exist_ok=True)
+    meta_path = os.path.join(collection_dir(collection), COLLECTION_META_FILE)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path)
+
+def collection_shard_dirs(collection=DEFAULT_COLLECTION):
+    """Directories of the collection's shards that currently hold an index (empty shards are skipped)."""
+    meta = load_collection_meta(collection)
+    if meta is None:
+        return []
+    dirs = [shard_dir(collection, shard) for shard in range(meta["n_shards"])]
+    return [d for d in dirs if faiss_index_exists(d)]
+
+def collection_exists(collection=DEFAULT_COLLECTION):
+    return bool(collection_shard_dirs(collection))
+
+def list_collections():
+    # Collections with an index or with uploaded files, so a new collection shows up before its first embed
+    names = set()
+    for root in (DB_DIR, UPLOAD_DIR):
+        if os.path.isdir(root):
+            names.update(n for n in os.listdir(root)
+                         if os.path.isdir(os.path.join(root, n)) and _COLLECTION_NAME_RE.match(n))
+    return sorted(names)
+
+def clear_collection(collection=DEFAULT_COLLECTION):
+    if os.path.exists(collection_dir(collection)):
+        shutil.rmtree(collection_dir(collection))
+
+def migrate_legacy_layout():
+    """
+    Moves a pre-collections layout (PDFs directly in UPLOAD_DIR, one index directly in DB_DIR)
+    into the single-shard default collection. Called once at app/service startup; a no-op
+    when there is nothing left to move.
+    """
+    legacy_pdfs = [n for n in os.listdir(UPLOAD_DIR) if n.lower().endswith(".pdf")]
+    if legacy_pdfs:
+        target_upload_dir = collection_upload_dir(DEFAULT_COLLECTION)
+        os.makedirs(target_upload_dir, exist_ok=True)
+        for name in legacy_pdfs:
+            os.replace(os.path.join(UPLOAD_DIR, name), os.path.join(target_upload_dir, name))
+        print(f"📦 Moved {len(legacy_pdfs)} PDF(s) into the '{DEFAULT_COLLECTION}' collection.")
 
-def clear_faiss_index():
-    if os.path.exists(DB_DIR):
-        shutil.rmtree(DB_DIR)
+    legacy_names = [n for n in os.listdir(DB_DIR) if os.path.isfile(os.path.join(DB_DIR, n))] if os.path.isdir(DB_DIR) else []
+    if "index.faiss" not in legacy_names:
+        return
+    target_dir = shard_dir(DEFAULT_COLLECTION, 0)
+    os.makedirs(target_dir, exist_ok=True)
+    for name in legacy_names + [BM25_DIR]:
+        if os.path.exists(os.path.join(DB_DIR, name)):
+            os.replace(os.path.join(DB_DIR, name), os.path.join(target_dir, name))
+    save_collection_meta(DEFAULT_COLLECTION, {"n_shards": 1})
+    print(f"📦 Moved the existing index into the '{DEFAULT_COLLECTION}' collection.")
 
-def save_uploaded_files(uploaded_files):
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+def get_embedding_model():
+    # One model per process, shared by ingest, index loading and every Streamlit session
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                _embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME,
+                                                         model_kwargs={"device": "cpu"})
+    return _embedding_model
+
+def get_document_embedder():
+    # Chunk embedder for ingest: the multi-process encoder behind the on-disk chunk-hash -> vector cache
+    return CachedEmbeddings(get_encoder(EMBEDDING_MODEL_NAME), EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP)
+
+def faiss_index_exists(db_dir):
+    # db_dir is one shard directory. Indexes from before the chunk store (index.pkl only)
+    # count as missing and get rebuilt
+    return (os.path.exists(os.path.join(db_dir, "index.faiss"))
+            and os.path.exists(os.path.join(db_dir, CHUNK_STORE_FILE)))
+
+def _build_bm25_index(db_dir):
+    # Lexical side of hybrid search, built over the chunk store just written so positions match FAISS
+    store = ChunkStore(os.path.join(db_dir, CHUNK_STORE_FILE))
+    try:
+        BM25Index.build(store.iter_texts()).save(db_dir)
+    finally:
+        store.close()
+
+def list_uploaded_files(collection=DEFAULT_COLLECTION):
+    upload_dir = collection_upload_dir(collection)
+    if not os.path.isdir(upload_dir):
+        return []
+    return sorted(
+        os.path.join(upload_dir, name)
+        for name in os.listdir(upload_dir)
+        if name.lower().endswith(".pdf")
+    )
+
+# --- MANIFEST ---
+# Maps each indexed file path to its content hash and the FAISS chunk IDs it produced:
+# {"files": {path: {"sha256": ..., "size": ..., "mtime_ns": ..., "chunk_ids": [...]}}}
+# size/mtime_ns let us reuse the stored hash instead of re-reading unchanged files.
+
+def load_manifest(db_dir):
+    manifest_path = os.path.join(db_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, db_dir):
+    os.makedirs(db_dir, exist_ok=True)
+    manifest_path = os.path.join(db_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)  # Never leave a half-written manifest behind
+
+def file_sha256(path, manifest=None):
+    stat = os.stat(path)
+    if manifest is not None:
+        entry = manifest["files"].get(os.path.normpath(path))
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_collection_manifest(collection=DEFAULT_COLLECTION):
+    # All shard manifests merged into one {"files": ...}, e.g. to reuse stored hashes
+    files = {}
+    meta = load_collection_meta(collection)
+    for shard in range(meta["n_shards"] if meta else 0):
+        files.update(load_manifest(shard_dir(collection, shard))["files"])
+    return {"files": files}
+
+def save_uploaded_files(uploaded_files, collection=DEFAULT_COLLECTION):
+    # Content-addressed: if the same bytes are already stored (under any name), reuse that file.
+    upload_dir = collection_upload_dir(collection)
+    os.makedirs(upload_dir, exist_ok=True)
+    manifest = load_collection_manifest(collection)
+    stored = {file_sha256(path, manifest): path for path in list_uploaded_files(collection)}
     paths = []
     for file in uploaded_files:
-        file_path = os.path.join(UPLOAD_DIR, file.name)
+        data = file.getbuffer()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in stored:
+            print(f"📎 Skipping {file.name}: identical file already stored as {os.path.basename(stored[digest])}")
+            paths.append(stored[digest])
+            continue
+        file_path = os.path.join(upload_dir, file.name)
         with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
+            f.write(data)
+        stored[digest] = file_path
         paths.append(file_path)
     return paths
 
-def embed_files_from_paths(file_paths):
-    all_docs = []
+def _load_and_split(path, digest):
+    # Runs inside a worker process: parse and chunk a single PDF.
+    # Stage timings are returned rather than recorded, since telemetry lives in the parent process.
+    started = time.perf_counter()
+    docs = PyMuPDFLoader(path).load()
+    loaded = time.perf_counter()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(docs)
+    timings = {"pdf_load": loaded - started, "split": time.perf_counter() - loaded}
+    # Chunk IDs are derived from the file's content hash, so they are stable across runs
+    ids = [f"{digest[:16]}-{i}" for i in range(len(chunks))]
+    return path, digest, len(docs), chunks, ids, timings
+
+class _ShardParser:
+    """
+    Parses the PDFs of every shard being synced in one process pool.
+
+    parsed(i) yields shard i's (path, digest, n_pages, chunks, ids, timings) as soon as each
+    file is parsed. Jobs are submitted in shard order, so once the current shard's files
+    are all in the pool, the next shard's start parsing while this one is still embedded
+    and written. At most MAX_INFLIGHT_FILES files are queued or waiting at once, so parsed
+    chunks waiting to be embedded never pile up however many files there are.
+
+    Workers are spawned rather than forked: ingest runs inside Streamlit, whose other
+    threads (and their locks) would be copied into a forked child mid-operation.
+    """
+
+    def __init__(self, job_lists, max_workers=INGEST_WORKERS):
+        self._jobs = job_lists
+        self._pending = deque((i, path, digest) for i, jobs in enumerate(job_lists) for path, digest in jobs)
+        self._done = [deque() for _ in job_lists]  # Parsed but not yet taken, per shard
+        self._inflight = {}  # future -> shard
+        self._pool = None
+        if max_workers > 1 and len(self._pending) > 1:
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _fill(self):
+        waiting = len(self._inflight) + sum(len(done) for done in self._done)
+        while self._pending and waiting < MAX_INFLIGHT_FILES:
+            i, path, digest = self._pending.popleft()
+            self._inflight[self._pool.submit(_load_and_split, path, digest)] = i
+            waiting += 1
+
+    def parsed(self, i):
+        if self._pool is None:
+            for path, digest in self._jobs[i]:
+                yield _load_and_split(path, digest)
+            return
+        for _ in range(len(self._jobs[i])):
+            self._fill()
+            while not self._done[i]:
+                done, _ = wait(self._inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._done[self._inflight.pop(future)].append(future)
+            yield self._done[i].popleft().result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+def _iter_chunk_batches(parsed_files, batch_size=EMBED_BATCH_SIZE):
+    # Re-slices the per-file chunk stream into fixed-size batches for the embedder
+    batch_chunks, batch_ids = [], []
+    for _, _, _, chunks, ids, _ in parsed_files:
+        batch_chunks.extend(chunks)
+        batch_ids.extend(ids)
+        while len(batch_chunks) >= batch_size:
+            yield batch_chunks[:batch_size], batch_ids[:batch_size]
+            batch_chunks, batch_ids = batch_chunks[batch_size:], batch_ids[batch_size:]
+    if batch_chunks:
+        yield batch_chunks, batch_ids
+
+def _manifest_entry(path, digest, chunk_ids):
+    stat = os.stat(path)
+    return {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunk_ids": chunk_ids}
+
+def _plan_shard_sync(current, manifest):
+    """
+    Diffs one shard's files ({path: sha256}) against its manifest. Returns the parse jobs,
+    the chunk IDs to delete and the duplicate paths; manifest["files"] is updated in place
+    for removed and shared-content files.
+    """
+    indexed = manifest["files"]
+    removed = [p for p in indexed if p not in current]
+    changed = [p for p in current if p in indexed and indexed[p]["sha256"] != current[p]]
+    added = [p for p in current if p not in indexed]
+
+    # Delete vectors of removed/changed files (unless another path still holds the same content)
+    stale_ids = []
+    for path in removed + changed:
+        entry = indexed.pop(path)
+        if not any(e["sha256"] == entry["sha256"] for e in indexed.values()):
+            stale_ids.extend(entry["chunk_ids"])
+
+    jobs = []
+    duplicates = {}  # queued path -> other paths with identical bytes
+    seen_digests = {e["sha256"]: p for p, e in indexed.items()}
+    for path in changed + added:
+        digest = current[path]
+        if digest in seen_digests:
+            # Same bytes already indexed (or queued) under another name: share its chunks
+            shared_path = seen_digests[digest]
+            if shared_path in indexed:
+                indexed[path] = _manifest_entry(path, digest, indexed[shared_path]["chunk_ids"])
+            else:
+                duplicates.setdefault(shared_path, []).append(path)
+            continue
+        jobs.append((path, digest))
+        seen_digests[digest] = path
+
+    return {
+        "dirty": bool(removed or changed or added),
+        "counts": (len(added), len(changed), len(removed)),
+        "jobs": jobs,
+        "stale_ids": stale_ids,
+        "duplicates": duplicates,
+    }
+
+def _sync_shard(db_dir, plan, manifest, incremental, parsed, document_embedder, progress, report, index_type,
+                storage):
+    # Applies a _plan_shard_sync plan to the index in db_dir and writes the shard back out;
+    # parsed yields the parsed files of plan["jobs"]. Chunk text goes straight from each
+    # embedded batch into the new chunk store; only the exact index's vectors stay in RAM.
+    indexed = manifest["files"]
+    duplicates = plan["duplicates"]
+    chunk_store_path = os.path.join(db_dir, CHUNK_STORE_FILE)
+    existing = incremental and faiss_index_exists(db_dir)
+
+    os.makedirs(db_dir, exist_ok=True)
+    writer = ChunkStoreWriter(chunk_store_path, copy_from=chunk_store_path if existing else None,
+                              drop_ids=plan["stale_ids"])
+    try:
+        index = None
+        if existing:
+            index = faiss.read_index(os.path.join(db_dir, "index.faiss"))
+            if writer.dropped_positions:
+                index.remove_ids(np.asarray(writer.dropped_positions, dtype=np.int64))
+
+        def parsed_files():
+            # Records each file in the manifest as it comes out of the pool
+            for path, digest, n_pages, chunks, ids, timings in parsed:
+                for stage, seconds in timings.items():
+                    telemetry.record(stage, seconds)
+                for indexed_path in [path] + duplicates.get(path, []):
+                    indexed[indexed_path] = _manifest_entry(indexed_path, digest, ids)
+                progress["files_done"] += 1
+                progress["pages"] += n_pages
+                progress["chunks"] += len(chunks)
+                report()
+                yield path, digest, n_pages, chunks, ids, timings
+
+        for batch_chunks, batch_ids in _iter_chunk_batches(parsed_files()):
+            with telemetry.span("embed"):
+                vectors = document_embedder.embed_documents([chunk.page_content for chunk in batch_chunks])
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+            writer.add(batch_ids, batch_chunks)
+            progress["embedded"] += len(batch_chunks)
+            report()
+    except BaseException:
+        writer.abort()
+        raise
+
+    if index is None or index.ntotal == 0:
+        # Nothing left in this shard (e.g. every file was removed)
+        writer.abort()
+        shutil.rmtree(db_dir)
+        save_manifest(manifest, db_dir)
+        return
+
+    with telemetry.span("index_write"):
+        write_index_atomic(index, os.path.join(db_dir, "index.faiss"))
+        writer.commit()
+        legacy_pickle = os.path.join(db_dir, "index.pkl")
+        if os.path.exists(legacy_pickle):
+            os.remove(legacy_pickle)
+        _build_bm25_index(db_dir)
+        build_ann_from_flat(index, index_type=index_type, db_dir=db_dir, storage=storage)
+        save_manifest(manifest, db_dir)
+
+def embed_files_from_paths(file_paths, incremental=False, progress_callback=None, index_type=ANN_INDEX_TYPE,
+                           collection=DEFAULT_COLLECTION, n_shards=None, storage=VECTOR_STORAGE):
+    """
+    Embeds the given PDFs into the collection's FAISS shards under DB_DIR/<collection>.
+
+    With incremental=False the collection is rebuilt from file_paths alone.
+    With incremental=True, file_paths is treated as the full corpus: only new or changed
+    files are parsed and embedded, and vectors of files no longer present are deleted by ID.
+
+    Each file goes to shard int(sha256[:8], 16) % n_shards, and only shards whose files
+    changed are rewritten. n_shards defaults to the collection's current shard count (or
+    DEFAULT_N_SHARDS for a new collection); changing it requires incremental=False.
+
+    PDFs are parsed and chunked in a process pool shared by all shards being rewritten
+    (the next shard parses while the current one embeds) and streamed into the embedder in
+    batches of EMBED_BATCH_SIZE, which are added to the index and written to the shard's
+    chunk store as they arrive; incremental runs copy and prune the old store inside SQLite.
+    Chunk text in RAM is therefore bounded by the parse window and one batch, whatever the
+    corpus size; the exact index's vectors (4 bytes per dimension per chunk) are the part
+    that still grows with it. Chunk vectors go through the on-disk embedding cache, so only never-seen chunk texts hit the model;
+    those are length-bucketed and encoded across the encoder.py worker processes.
+
+    index.faiss always holds the exact (flat) index so vectors can be added and deleted by ID;
+    a separate IVF/HNSW/PQ search index is rebuilt from it afterwards (see ann_index.py).
+    index_type forces one of ann_index.INDEX_TYPES; None chooses by chunk count.
+    storage ("float32", "float16" or "int8") sets how the search index stores vectors.
+    progress_callback, if given, is called with a dict of counters
+    (files_done, files_total, pages, chunks, embedded) after every file and batch.
+    """
+    if n_shards is not None and n_shards < 1:
+        raise ValueError(f"n_shards must be at least 1, got {n_shards}.")
+    meta = load_collection_meta(collection)
+    current_shards = meta["n_shards"] if meta else None
+    n_shards = n_shards or current_shards or DEFAULT_N_SHARDS
+    if incremental and current_shards and n_shards != current_shards:
+        raise ValueError(f"Collection '{collection}' has {current_shards} shard(s); "
+                         f"rebuild it (incremental=False) to change to {n_shards}.")
+    if not incremental:
+        clear_collection(collection)
+    save_collection_meta(collection, {"n_shards": n_shards})
+
+    shard_dirs = [shard_dir(collection, shard) for shard in range(n_shards)]
+    manifests = [
+        load_manifest(d) if (incremental and faiss_index_exists(d)) else {"files": {}} for d in shard_dirs
+    ]
+    known_files = {"files": {p: e for m in manifests for p, e in m["files"].items()}}
+
+    current = [{} for _ in shard_dirs]  # Per shard: {path: sha256}
     for path in file_paths:
-        loader = PyMuPDFLoader(path)
-        docs = loader.load()
-        all_docs.extend(docs)
+        path = os.path.normpath(path)
+        digest = file_sha256(path, known_files)
+        current[shard_for_digest(digest, n_shards)][path] = digest
+
+    plans = [_plan_shard_sync(current[i], manifests[i]) for i in range(n_shards)]
+    dirty = [i for i, plan in enumerate(plans) if plan["dirty"]]
+    if not dirty:
+        print("✅ Index already up to date, nothing to embed.")
+        return True
+
+    added, changed, removed = (sum(plan["counts"][i] for plan in plans) for i in range(3))
+    print(f"📚 Index sync ({collection}): {added} new, {changed} changed, {removed} removed file(s); "
+          f"{sum(len(plan['jobs']) for plan in plans)} file(s) to parse, "
+          f"{sum(len(plan['stale_ids']) for plan in plans)} stale chunk(s) to delete, "
+          f"{len(dirty)}/{n_shards} shard(s) to rewrite.")
+
+    document_embedder = get_document_embedder()
+    progress = {"files_done": 0, "files_total": sum(len(plan["jobs"]) for plan in plans),
+                "pages": 0, "chunks": 0, "embedded": 0}
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(all_docs)
-    embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    def report():
+        if progress_callback is not None:
+            progress_callback(dict(progress))
 
-    vectordb = FAISS.from_documents(chunks, embedding)
-    vectordb.save_local(DB_DIR)
+    parser = _ShardParser([plans[i]["jobs"] for i in dirty])
+    try:
+        for position, i in enumerate(dirty):
+            _sync_shard(shard_dirs[i], plans[i], manifests[i], incremental, parser.parsed(position),
+                        document_embedder, progress, report, index_type, storage)
+    finally:
+        parser.close()
+        if progress["embedded"]:
+            print(f"🗃️ Embedding cache: {document_embedder.hits} hit(s), {document_embedder.misses} miss(es).")
+        document_embedder.close()
     return True
 
-def load_faiss_index():
-    embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2",
-                                      model_kwargs={"device": "cpu"})
-    vectordb = FAISS.load_local(DB_DIR, embedding, allow_dangerous_deserialization=True)
-    return vectordb.as_retriever(search_kwargs={"k": 3})
+def load_faiss_vectorstore(db_dir, embedding=None, nprobe=None, ef_search=None):
+    """
+    Loads one shard's index for searching: the ANN index if one was built, else the flat
+    index, memory-mapped as far as FAISS allows (see ann_index.read_index_mmap). Chunk
+    text/metadata is fetched from the SQLite chunk store only for the hits a search returns.
+    nprobe/ef_search override the search parameters stored with the ANN index.
+    embedding lets callers put a query-side wrapper (e.g. an LRU cache) around the shared model.
+    """
+    store = ChunkStore(os.path.join(db_dir, CHUNK_STORE_FILE))
+    index = load_search_index(db_dir, nprobe=nprobe, ef_search=ef_search)
+    return FAISS(embedding or get_embedding_model(), index, LazyDocstore(store), LazyIndexToDocstoreId(store))
+
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -0,0 +1,123 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+ENCODER_THREADS_PER_WORKER = 2  # torch intra-op threads in each worker process
+# Half the cores go to encoding; the PDF parsing pool in embeddings.py runs alongside it
+ENCODER_WORKERS = max(1, (os.cpu_count() or 2) // (2 * ENCODER_THREADS_PER_WORKER))
+ENCODE_BATCH_SIZE = 32  # Texts per forward pass; one pool task each
+
+# --- WORKER PROCESS ---
+# Each worker loads its own copy of the model once, in the pool initializer.
+
+_worker_model = None
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+def _encode_batch(texts):
+    # Same call HuggingFaceEmbeddings makes, so vectors match the query-side model
+    vectors = _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def length_bucketed_batches(texts, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Splits text indices into batches of similar length. Every sequence in a batch is padded
+    to the longest one, so sorting by length first keeps short chunks from paying for long ones.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class ParallelEncoder(Embeddings):
+    """
+    Document encoder spread over a pool of worker processes, each running the
+    sentence-transformers model with threads_per_worker torch threads.
+
+    embed_documents sorts texts into length buckets, encodes the batches in parallel and
+    returns vectors in the original order. The pool is started on first use and kept for
+    later calls, so the model is loaded once per worker rather than once per ingest.
+    """
+
+    def __init__(self, model_name, workers=ENCODER_WORKERS, threads_per_worker=ENCODER_THREADS_PER_WORKER,
+                 batch_size=ENCODE_BATCH_SIZE, bucket_by_length=True):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.batch_size = batch_size
+        self.bucket_by_length = bucket_by_length
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # Spawned, not forked: the parent usually has torch's thread pool running already
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.model_name, self.threads_per_worker),
+                    )
+        return self._pool
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        if self.bucket_by_length:
+            batches = length_bucketed_batches(texts, self.batch_size)
+        else:
+            batches = [list(range(s, min(s + self.batch_size, len(texts)))) for s in range(0, len(texts), self.batch_size)]
+        pool = self._get_pool()
+        vectors = [None] * len(texts)
+        try:
+            futures = [pool.submit(_encode_batch, [texts[i] for i in batch]) for batch in batches]
+            for batch, future in zip(batches, futures):
+                for i, vector in zip(batch, future.result()):
+                    vectors[i] = vector.tolist()
+        except BrokenProcessPool:
+            # A worker died (e.g. the model failed to download); start a fresh pool next call
+            self._discard_pool(pool)
+            raise
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_encoder(model_name):
+    # One pool of encoder workers per process, reused by every ingest
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = ParallelEncoder(model_name)
+                atexit.register(_encoder.close)
+    return _encoder
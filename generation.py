@@ -1,90 +1,172 @@
-import pyttsx3
-import speech_recognition as sr
+from itertools import cycle
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
 from langchain_mistralai.chat_models import ChatMistralAI
-import threading
+import time
+import asyncio
+from tts_worker import get_tts_worker
+from conversation_memory import BudgetedConversationMemory, estimate_tokens, is_self_contained
+import telemetry
 
-# Constants for listen_query results
-LISTENING_TIMEOUT = "LISTENING_TIMEOUT"
-STOP_COMMAND_RECEIVED = "STOP_COMMAND_RECEIVED"
-SPEECH_RECOGNITION_ERROR = "SPEECH_RECOGNITION_ERROR_PREFIX" # Prefix to append specific error
+# BackgroundListener and its result values, re-exported for app.py
+from listener import (
+    LISTENING_TIMEOUT,
+    STOP_COMMAND_RECEIVED,
+    SPEECH_RECOGNITION_ERROR,
+    BackgroundListener,
+)
 
-def get_llm_chain(retriever, memory):
-    llm = ChatMistralAI(
+def get_llm():
+    return ChatMistralAI(
         model="mistral-small-latest",
         api_key="2WIkmsiJYxWE610QFydCaA5LJJIyPl0h", # REMINDER: Consider using Streamlit secrets or env variables
         temperature=0.7
     )
+
+class FakeChatModel(GenericFakeChatModel):
+    """GenericFakeChatModel plus a fixed per-call delay, to stand in for a remote LLM's latency."""
+
+    latency: float = 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return super()._generate(messages, stop=stop, **kwargs)
+
+def get_fake_llm(responses=None, latency=0.0):
+    # Deterministic, offline stand-in for ChatMistralAI; streams its canned replies word by word
+    responses = responses or ["This is a canned answer from the local fake model, based on the retrieved context."]
+    return FakeChatModel(messages=cycle([AIMessage(content=r) for r in responses]), latency=latency)
+
+def get_llm_chain(retriever, memory, llm=None):
     return ConversationalRetrievalChain.from_llm(
-        llm=llm,
+        llm=llm or get_llm(),
         retriever=retriever,
-        memory=memory
+        memory=memory,
+        return_source_documents=True,
     )
 
-def speak_text(text):
-    def run_tts():
-        try:
-            # Attempt to clean text for TTS
-            safe_text = ''.join(char for char in text if char.isprintable())
-            engine = pyttsx3.init()
-            engine.setProperty('rate', 170) # Adjust rate as needed
-            # Optional: Get available voices and set one if desired
-            # voices = engine.getProperty('voices')
-            # engine.setProperty('voice', voices[0].id) # Example: set to the first available voice
-            engine.say(safe_text)
-            engine.runAndWait()
-        except RuntimeError as e:
-            print(f"TTS pyttsx3 RuntimeError: {e}. Often related to re-initialization or event loop issues.")
-            # Try to recover or simply skip speaking if engine is busy
-            try:
-                engine.stop() # Attempt to stop any previous run
-            except Exception as stop_e:
-                print(f"TTS: Error trying to stop engine: {stop_e}")
-        except Exception as e:
-            print(f"TTS General Error: {e}")
-        finally:
-            # It's tricky to manage engine.stop() and del engine here
-            # if the instance is meant to be reused or if errors occur during init.
-            # For single use in a thread, stopping might be okay.
-            # If you encounter "AttributeError: 'NoneType' object has no attribute 'runAndWait'"
-            # it might mean engine failed to initialize.
-            pass # Let thread end
-
-
-    tts_thread = threading.Thread(target=run_tts)
-    tts_thread.start()
-    tts_thread.join() # This still makes the main Streamlit thread wait for TTS to complete.
-
-def listen_query(timeout=7, phrase_time_limit=12): # Increased timeouts slightly
-    recognizer = sr.Recognizer()
-    # You might want to adjust energy_threshold dynamically if ambient noise is an issue
-    # recognizer.energy_threshold = 4000 # Example: adjust this value
-    # recognizer.dynamic_energy_threshold = True
-
-    with sr.Microphone() as source:
-        try:
-            print(f"🎤 Adjusting for ambient noise (1 sec)...")
-            recognizer.adjust_for_ambient_noise(source, duration=1) # Adjust for ambient noise
-            print(f"🎤 Listening for your query (timeout: {timeout}s, phrase_limit: {phrase_time_limit}s)...")
-            audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
-            query = recognizer.recognize_google(audio).lower().strip()
-            print(f"✅ You said: {query}") # For debugging
-
-            stop_commands = ["goodbye", "stop listening", "exit chat", "end chat", "terminate session"]
-            if query in stop_commands:
-                return STOP_COMMAND_RECEIVED
-            if not query: # If recognizer returns empty string
-                return LISTENING_TIMEOUT # Treat as no meaningful input
-            return query
-        except sr.WaitTimeoutError:
-            print("⏱️ No speech detected within timeout.")
-            return LISTENING_TIMEOUT
-        except sr.UnknownValueError:
-            print("❓ Google Speech Recognition could not understand audio")
-            return SPEECH_RECOGNITION_ERROR + "::Could not understand audio"
-        except sr.RequestError as e:
-            print(f"Could not request results from Google Speech Recognition service; {e}")
-            return SPEECH_RECOGNITION_ERROR + f"::Service error - {e}"
-        except Exception as e:
-            print(f"An unexpected error occurred during speech recognition: {e}")
-            return SPEECH_RECOGNITION_ERROR + f"::Unexpected SR error - {e}"
+def chat_history_str(chain):
+    history = chain.memory.load_memory_variables({})[chain.memory.memory_key]
+    return (chain.get_chat_history or _get_chat_history)(history) if history else ""
+
+def condense_prompt(chain, question, history_str):
+    # The chain's question-generator prompt, for callers that run the LLM call themselves
+    return chain.question_generator.prompt.format_prompt(question=question, chat_history=history_str)
+
+def plan_condense(chain, question, history_str, fast_path=True):
+    """
+    Decides whether this turn needs the question-condensing LLM call.
+
+    Returns (prompt, usage): prompt is the condense prompt to send, or None when the question
+    is searched as is - there is no history, or fast_path is on and the question is
+    self-contained. usage counts the LLM calls and estimated prompt tokens spent and saved
+    so far; saved tokens include history the bounded memory kept out of the prompt.
+    """
+    usage = {"llm_calls": 0, "prompt_tokens": 0, "saved_llm_calls": 0, "saved_prompt_tokens": 0}
+    if not history_str:
+        return None, usage  # The chain skips condensing here too, so nothing is saved
+    memory = chain.memory
+    bounded_savings = 0
+    if isinstance(memory, BudgetedConversationMemory):
+        bounded_savings = max(0, memory.unbounded_tokens - memory.history_tokens())
+    prompt = condense_prompt(chain, question, history_str)
+    prompt_tokens = estimate_tokens(prompt.to_string())
+    if fast_path and is_self_contained(question):
+        usage["saved_llm_calls"] = 1
+        usage["saved_prompt_tokens"] = prompt_tokens + bounded_savings
+        return None, usage
+    usage["llm_calls"] = 1
+    usage["prompt_tokens"] = prompt_tokens
+    usage["saved_prompt_tokens"] = bounded_savings
+    return prompt, usage
+
+def searched_as_asked(chain, question, fast_path=True):
+    """
+    True when this turn searches the question exactly as asked (no condensing against history).
+    Only such turns may use the shared answer cache: an answer to a condensed follow-up
+    depends on this conversation.
+    """
+    condense, _ = plan_condense(chain, question, chat_history_str(chain), fast_path)
+    return condense is None
+
+def answer_prompt(chain, docs, question, new_question, history_str):
+    combine_chain = chain.combine_docs_chain  # StuffDocumentsChain: formats docs into the QA prompt
+    inputs = combine_chain._get_inputs(
+        docs, question=new_question if chain.rephrase_question else question, chat_history=history_str
+    )
+    return combine_chain.llm_chain.prompt.format_prompt(**inputs)
+
+def stream_answer(chain, question, fast_path=True):
+    """
+    Runs the same steps as chain.invoke({"question": question}) but streams the answer.
+
+    Yields ("token", text) for every token of the answer as the LLM produces it, then a
+    single ("done", result) where result has "answer", "source_documents", "timing"
+    ({"ttft": seconds to first token, "total": seconds for the whole turn}) and "usage"
+    (see plan_condense). The turn is saved to chain.memory just like a normal invoke.
+    With fast_path, self-contained questions skip the condensing LLM call.
+    """
+    start = time.perf_counter()
+    memory = chain.memory
+    history_str = chat_history_str(chain)
+
+    # Condense a follow-up into a standalone question, as the chain does
+    new_question = question
+    condense, usage = plan_condense(chain, question, history_str, fast_path)
+    if condense is not None:
+        with telemetry.span("condense_question"):
+            message = chain.question_generator.llm.invoke(condense)
+            new_question = getattr(message, "content", message)
+
+    docs = chain.retriever.invoke(new_question)
+
+    prompt = answer_prompt(chain, docs, question, new_question, history_str)
+    usage["llm_calls"] += 1
+    usage["prompt_tokens"] += estimate_tokens(prompt.to_string())
+
+    answer_parts = []
+    ttft = None
+    llm_started = time.perf_counter()
+    for chunk in chain.combine_docs_chain.llm_chain.llm.stream(prompt):
+        token = getattr(chunk, "content", chunk)
+        if not token:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        answer_parts.append(token)
+        yield "token", token
+    # Includes time the caller spends rendering between tokens, as the user experiences it
+    telemetry.record("answer_llm", time.perf_counter() - llm_started)
+
+    answer = "".join(answer_parts)
+    memory.save_context({"question": question}, {"answer": answer})
+    total = time.perf_counter() - start
+    yield "done", {
+        "answer": answer,
+        "source_documents": docs,
+        "timing": {"ttft": ttft if ttft is not None else total, "total": total},
+        "usage": usage,
+    }
+
+def speak_text(text, turn_id=None):
+    # Non-blocking: hands the text to the shared TTS worker and returns immediately.
+    # turn_id tags the worker's "tts" log record so it can be joined with the turn's record.
+    get_tts_worker().speak(text, turn_id)
+
+def stop_speaking():
+    get_tts_worker().cancel()
+
+def is_speaking():
+    return get_tts_worker().is_busy()
+
+def start_background_listener(phrase_time_limit=12):
+    # Continuous capture for the voice loop; ignores audio while the bot is speaking
+    return BackgroundListener(phrase_time_limit=phrase_time_limit, pause_while=is_speaking).start()
@@ -0,0 +1,196 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import speech_recognition as sr
+import telemetry
+
+
+# Result values pushed to the listener queue (re-exported by generation.py for app.py)
+LISTENING_TIMEOUT = "LISTENING_TIMEOUT"
+STOP_COMMAND_RECEIVED = "STOP_COMMAND_RECEIVED"
+SPEECH_RECOGNITION_ERROR = "SPEECH_RECOGNITION_ERROR_PREFIX" # Prefix to append specific error
+
+STOP_COMMANDS = ["goodbye", "stop listening", "exit chat", "end chat", "terminate session"]
+CALIBRATION_DURATION = 1.0
+RECALIBRATE_EVERY = 120.0  # Seconds between ambient-noise re-calibrations, done after a silent listen() only
+
+# Last calibrated energy threshold, reused by every listener in this process
+_calibrated_energy_threshold = None
+_calibrated_at = 0.0
+
+
+def google_transcriber(recognizer, audio):
+    return recognizer.recognize_google(audio)
+
+def sphinx_transcriber(recognizer, audio):
+    # Fully offline alternative (needs `pip install pocketsphinx`)
+    return recognizer.recognize_sphinx(audio)
+
+def microphone_sources():
+    # A single persistent microphone stream
+    yield sr.Microphone()
+
+def wav_file_sources(paths):
+    """
+    Feeds WAV files instead of a live microphone, e.g. to exercise the voice loop offline.
+    Use with calibration_duration=0 so calibration doesn't swallow the start of each file.
+    """
+    def sources():
+        for path in paths:
+            yield sr.AudioFile(path)
+    return sources
+
+def _exhausted(source):
+    reader = getattr(source, "audio_reader", None)  # Only file sources have one
+    return reader is not None and reader.tell() >= source.FRAME_COUNT
+
+def classify_transcript(text):
+    query = (text or "").lower().strip()
+    if query in STOP_COMMANDS:
+        return STOP_COMMAND_RECEIVED
+    if not query: # If recognizer returns empty string
+        return LISTENING_TIMEOUT # Treat as no meaningful input
+    return query
+
+
+class BackgroundListener:
+    """
+    Captures speech on a background thread and pushes recognized queries into a queue.
+
+    The microphone is opened once and calibrated once (the threshold is cached for the
+    whole process and refreshed every RECALIBRATE_EVERY seconds). The recognizer's
+    energy-based voice-activity detection cuts each utterance; utterances are transcribed
+    on a second thread so capture continues during the network call. app.py polls
+    results with poll() on each rerun instead of blocking inside listen(); after each
+    poll, last_timings holds the listen/recognition seconds behind that result, since
+    those stages run outside the caller's trace_turn().
+
+    sources: callable returning an iterable of sr.AudioSource (microphone_sources by default,
+             or wav_file_sources([...]) for offline runs).
+    transcriber: callable(recognizer, audio) -> text (google_transcriber by default).
+    pause_while: optional callable; while it returns True, captured audio is discarded
+                 (used to ignore the bot's own TTS output).
+    """
+
+    def __init__(self, sources=microphone_sources, transcriber=google_transcriber,
+                 phrase_time_limit=12, pause_while=None, calibration_duration=CALIBRATION_DURATION):
+        self.sources = sources
+        self.transcriber = transcriber
+        self.phrase_time_limit = phrase_time_limit
+        self.pause_while = pause_while
+        self.calibration_duration = calibration_duration
+        self.results = queue.Queue()
+        self.recognizer = sr.Recognizer()
+        self._stop_event = threading.Event()
+        self._finished = threading.Event()
+        self._transcribe_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sr-transcribe")
+        self._thread = None
+        self.error = None  # Exception that stopped the capture thread, if any
+        self.last_timings = {}  # {"listen": s, "recognition": s} of the result last returned by poll()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sr-listener", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_running(self):
+        return self._thread is not None and not self._finished.is_set()
+
+    def failed(self):
+        # True once the capture thread has died (no microphone, PyAudio missing...); its error is queued by then
+        return self.error is not None
+
+    def poll(self):
+        """Returns the next recognized result, or None if nothing is ready yet."""
+        try:
+            result, self.last_timings = self.results.get_nowait()
+        except queue.Empty:
+            return None
+        return result
+
+    def wait_until_done(self, timeout=None):
+        # For offline runs: blocks until all sources are consumed and transcribed
+        self._finished.wait(timeout)
+        self._transcribe_pool.shutdown(wait=True)
+
+    # --- CAPTURE THREAD ---
+
+    def _paused(self):
+        return self.pause_while is not None and self.pause_while()
+
+    def _calibrate(self, source):
+        global _calibrated_energy_threshold, _calibrated_at
+        if not self.calibration_duration:
+            return
+        stale = time.monotonic() - _calibrated_at > RECALIBRATE_EVERY
+        if _calibrated_energy_threshold is None or stale:
+            print(f"🎤 Adjusting for ambient noise ({self.calibration_duration} sec)...")
+            self.recognizer.adjust_for_ambient_noise(source, duration=self.calibration_duration)
+            _calibrated_energy_threshold = self.recognizer.energy_threshold
+            _calibrated_at = time.monotonic()
+        else:
+            self.recognizer.energy_threshold = _calibrated_energy_threshold
+
+    def _run(self):
+        try:
+            for source_cm in self.sources():
+                if self._stop_event.is_set():
+                    break
+                with source_cm as source:
+                    self._calibrate(source)
+                    self._capture(source)
+        except Exception as e:
+            print(f"An unexpected error occurred in the background listener: {e}")
+            self.results.put((SPEECH_RECOGNITION_ERROR + f"::Unexpected SR error - {e}", {}))
+            self.error = e
+        finally:
+            self._finished.set()
+
+    def _capture(self, source):
+        while not self._stop_event.is_set():
+            if self._paused():
+                time.sleep(0.1)
+                continue
+            try:
+                # Short timeout so stop() and pausing are noticed quickly during silence
+                audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=self.phrase_time_limit)
+            except sr.WaitTimeoutError:
+                # Only re-measure the room during silence, never over the user's speech
+                if time.monotonic() - _calibrated_at > RECALIBRATE_EVERY:
+                    self._calibrate(source)
+                continue
+            # Length of the captured utterance: the part of "listening" the user actually waits on
+            listen_seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+            telemetry.record("listen", listen_seconds)
+            if self._paused():
+                continue  # Captured while the bot was talking
+            if audio.frame_data:
+                self._transcribe_pool.submit(self._transcribe, audio, listen_seconds)
+            if _exhausted(source):
+                return  # Finite source (WAV file) fully consumed
+
+    def _transcribe(self, audio, listen_seconds):
+        started = time.perf_counter()
+        try:
+            result = classify_transcript(self.transcriber(self.recognizer, audio))
+            if result != LISTENING_TIMEOUT:
+                print(f"✅ You said: {result}") # For debugging
+        except sr.UnknownValueError:
+            print("❓ Speech recognition could not understand audio")
+            result = SPEECH_RECOGNITION_ERROR + "::Could not understand audio"
+        except sr.RequestError as e:
+            print(f"Could not request results from the speech recognition service; {e}")
+            result = SPEECH_RECOGNITION_ERROR + f"::Service error - {e}"
+        except Exception as e:
+            print(f"An unexpected error occurred during speech recognition: {e}")
+            result = SPEECH_RECOGNITION_ERROR + f"::Unexpected SR error - {e}"
+        recognition_seconds = time.perf_counter() - started
+        telemetry.record("recognition", recognition_seconds)
+        if result == LISTENING_TIMEOUT:
+            return
+        self.results.put((result, {"listen": round(listen_seconds, 6), "recognition": round(recognition_seconds, 6)}))
@@ -0,0 +1,131 @@
+"""
+Load test for service.py: throughput and latency at increasing client concurrency.
+
+Starts the service in-process against the offline fake LLM (with a fixed per-call latency
+standing in for Mistral's round trip), builds a synthetic corpus in a scratch directory,
+then runs closed-loop clients - each sends its next question as soon as the previous
+answer arrives - at every concurrency level. Results are written as JSON next to the
+benchmark.py results.
+
+    python load_test.py --concurrency 1,2,4,8,16,32 --requests 64 --llm-latency 0.2
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+import aiohttp
+from aiohttp import web
+from benchmark import make_synthetic_pdfs, make_queries, latency_summary
+
+
+async def _client(session, url, conversation_id, questions, latencies):
+    for question in questions:
+        started = time.perf_counter()
+        async with session.post(url, json={"conversation_id": conversation_id, "question": question}) as response:
+            response.raise_for_status()
+            await response.json()
+        latencies.append(time.perf_counter() - started)
+
+async def run_level(base_url, concurrency, n_requests, queries):
+    """n_requests spread over `concurrency` clients, one conversation per client."""
+    per_client = max(1, n_requests // concurrency)
+    latencies = []
+    async with aiohttp.ClientSession() as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _client(session, f"{base_url}/query", f"load-{concurrency}-{c}",
+                    queries[c * per_client:(c + 1) * per_client], latencies)
+            for c in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        async with session.get(f"{base_url}/stats") as response:
+            stats = await response.json()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency": latency_summary(latencies),
+        "embed_batcher": stats["embed_batcher"],
+    }
+
+async def run(args):
+    # Imported here so the scratch directory is the working directory for relative paths
+    import embeddings
+    import service
+    from registry import index_registry
+
+    if not embeddings.collection_exists():
+        print(f"📄 Building a {args.files}-PDF synthetic corpus...")
+        make_synthetic_pdfs(embeddings.collection_upload_dir(), args.files, args.pages)
+        embeddings.embed_files_from_paths(embeddings.list_uploaded_files())
+
+    service_args = service.parse_args([
+        "--fake-llm", "--llm-latency", str(args.llm_latency), "--llm-concurrency", str(args.llm_concurrency),
+    ])
+    runner = web.AppRunner(await service.build_app(service_args))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    queries = make_queries(args.requests * len(levels) + max(levels), seed=7)
+    results = []
+    try:
+        for i, concurrency in enumerate(levels):
+            index_registry.answer_cache.clear()  # Every level pays for retrieval and the LLM
+            level_queries = queries[i * args.requests:(i + 1) * args.requests + concurrency]
+            result = await run_level(base_url, concurrency, args.requests, level_queries)
+            print(f"  c={concurrency:>3}  {result['throughput_rps']:>8.2f} req/s  "
+                  f"p50 {result['latency']['p50_ms']:.0f} ms  p95 {result['latency']['p95_ms']:.0f} ms  "
+                  f"mean embed batch {result['embed_batcher']['mean_batch_size']}")
+            results.append(result)
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--llm-concurrency", type=int, default=32, help="Service LLM concurrency limit")
+    parser.add_argument("--files", type=int, default=20, help="Synthetic PDFs if no index exists")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default="./bench_results", help="Directory for the JSON results")
+    parser.add_argument("--use-existing-index", action="store_true",
+                        help="Query the default collection in ./faiss_index instead of a synthetic corpus")
+    args = parser.parse_args(argv)
+
+    out_dir = os.path.abspath(args.out)
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="rag_load_") as work_dir:
+        if not args.use_existing_index:
+            os.chdir(work_dir)
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(original_cwd)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "levels": results,
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {out_path}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import telemetry
+
+
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.95  # Cosine similarity needed to reuse a cached answer
+_IDENTIFIER_RE = re.compile(r"[\w.-]*\d[\w.-]*")
+
+
+def normalize_query(text):
+    # "What is the refund policy?" and "what is the  refund policy" share one cache entry
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+def identifier_tokens(text):
+    # Part numbers, clause IDs, years...: "part A-113" and "part A-114" embed almost identically
+    return frozenset(token.strip(".-") for token in _IDENTIFIER_RE.findall(text.lower()))
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embedder whose embed_query is memoized in an LRU keyed by normalized query text.
+
+    Only model calls are recorded as "query_embed" spans. LRU hits are not, so a turn that
+    embeds its question and then hits the LRU in the retriever counts one embedding, and the
+    stage's percentiles show what the model costs.
+    """
+
+    def __init__(self, embedder, max_size=QUERY_EMBEDDING_CACHE_SIZE):
+        self.embedder = embedder
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return list(vector)
+            self.stats.misses += 1
+
+        with telemetry.span("query_embed"):
+            vector = self.embedder.embed_query(text)
+        self._remember(key, vector)
+        return list(vector)
+
+    def embed_queries(self, texts):
+        """
+        embed_query for many queries at once: cache misses go through the model as one
+        batch. Used by the service's micro-batcher to serve concurrent requests with a
+        single forward pass.
+        """
+        keys = [normalize_query(text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = {}  # key -> first index of a text with that key
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    vectors[i] = vector
+                elif key not in missing:
+                    self.stats.misses += 1
+                    missing[key] = i
+        if missing:
+            # all-MiniLM embeds queries and documents the same way, so a document batch is exact
+            with telemetry.span("query_embed"):
+                computed = self.embedder.embed_documents([texts[i] for i in missing.values()])
+            for key, vector in zip(missing, computed):
+                self._remember(key, vector)
+            by_key = dict(zip(missing, computed))
+            vectors = [v if v is not None else by_key[key] for v, key in zip(vectors, keys)]
+        return [list(v) for v in vectors]
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+
+class SemanticAnswerCache:
+    """
+    Returns a stored (answer, sources) when a new query embedding is within `threshold`
+    cosine similarity of a cached one and both questions mention the same identifiers
+    (tokens containing a digit), which the embedding alone barely tells apart.
+
+    Only cache answers to questions that were searched as asked: an answer to a follow-up
+    condensed against one conversation's history is wrong for anyone else asking the same words.
+
+    Entries are tagged with the index version they were answered against (for the registry,
+    which collections were searched and at which swap) and only match lookups with the same
+    version, so answers never outlive the index that produced them. Callers searching
+    different collections share the cache without invalidating each other; entries for
+    replaced indexes simply age out of the LRU.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._vectors = []  # Unit-normalized query embeddings, oldest first
+        self._entries = []  # (answer, sources, identifier tokens, index version), parallel to _vectors
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector, index_version, question):
+        identifiers = identifier_tokens(question)
+        with self._lock:
+            if self._vectors:
+                similarities = np.stack(self._vectors) @ self._unit(query_vector)
+                similarities[[entry[2:] != (identifiers, index_version) for entry in self._entries]] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.stats.hits += 1
+                    # Move to the end so the least recently used entry is evicted first
+                    self._vectors.append(self._vectors.pop(best))
+                    self._entries.append(self._entries.pop(best))
+                    return self._entries[-1][:2]
+            self.stats.misses += 1
+            return None
+
+    def store(self, query_vector, answer, sources, index_version, question):
+        with self._lock:
+            self._vectors.append(self._unit(query_vector))
+            self._entries.append((answer, sources, identifier_tokens(question), index_version))
+            while len(self._vectors) > self.max_size:
+                self._vectors.pop(0)
+                self._entries.pop(0)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._vectors, self._entries = [], []
@@ -0,0 +1,240 @@
+import os
+import threading
+import contextvars
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from embeddings import DEFAULT_COLLECTION, get_embedding_model, collection_shard_dirs, load_faiss_vectorstore
+from query_cache import CachedQueryEmbeddings, SemanticAnswerCache
+from bm25 import BM25Index
+import telemetry
+
+HYBRID_FETCH_K = 20  # Candidates taken from each of the dense and BM25 searches before fusion
+RRF_K = 60
+MAX_LOADED_COLLECTIONS = 8  # Least recently queried collections beyond this are unloaded
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)  # FAISS releases the GIL, so shards search in parallel
+
+
+class IndexRegistry:
+    """
+    Holds the embedding model and the loaded FAISS indexes once per process.
+
+    Streamlit re-executes app.py on every rerun and for every browser session, but imported
+    modules are shared, so sessions all read from this single copy of each index. A
+    collection is loaded the first time it is queried, as a tuple of (vectordb, bm25) pairs,
+    one per shard; at most MAX_LOADED_COLLECTIONS stay loaded. After a re-embed, reload()
+    loads the collection off to the side and swaps it in with a single reference
+    assignment; searches already running keep using the old one.
+
+    Query embeddings go through a process-wide LRU, and answer_cache is shared by all
+    sessions; entries are tagged with version_key(), so a swap of a searched collection
+    retires the answers that depended on it.
+    """
+
+    def __init__(self, max_loaded=MAX_LOADED_COLLECTIONS):
+        self._lock = threading.Lock()
+        self._collections = OrderedDict()  # name -> tuple of (vectordb, bm25 or None), one per shard
+        self._versions = {}  # name -> value of `version` when it was last swapped
+        self._query_embedder = None
+        self.max_loaded = max_loaded
+        self.answer_cache = SemanticAnswerCache()
+        self.version = 0  # Bumped on every swap, so caches can tell an index changed
+        self.nprobe = None  # Overrides for the values stored with each ANN index; None = stored
+        self.ef_search = None
+
+    def get_query_embedder(self):
+        if self._query_embedder is None:
+            with self._lock:
+                if self._query_embedder is None:
+                    self._query_embedder = CachedQueryEmbeddings(get_embedding_model())
+        return self._query_embedder
+
+    def _load_state(self, collection):
+        embedder = self.get_query_embedder()
+        return tuple(
+            (load_faiss_vectorstore(db_dir, embedder, nprobe=self.nprobe, ef_search=self.ef_search),
+             BM25Index.load(db_dir))
+            for db_dir in collection_shard_dirs(collection)
+        )
+
+    def _swap_in(self, collection, state):
+        # Caller holds self._lock
+        self.version += 1
+        self._versions[collection] = self.version
+        self._collections[collection] = state
+        self._collections.move_to_end(collection)
+        while len(self._collections) > self.max_loaded:
+            self._collections.popitem(last=False)
+
+    def warm(self, collections=(DEFAULT_COLLECTION,)):
+        self.get_query_embedder()
+        for collection in collections:
+            if collection not in self._collections and collection_shard_dirs(collection):
+                self.get_state(collection)
+
+    def get_state(self, collection=DEFAULT_COLLECTION):
+        state = self._collections.get(collection)
+        if state is None:
+            self.get_query_embedder()
+            new_state = self._load_state(collection)
+            if not new_state:
+                return ()  # Nothing embedded in this collection yet
+            with self._lock:
+                state = self._collections.get(collection)
+                if state is None:
+                    self._swap_in(collection, new_state)
+                    state = new_state
+        else:
+            with self._lock:
+                if collection in self._collections:
+                    self._collections.move_to_end(collection)
+        return state
+
+    def reload(self, collection=DEFAULT_COLLECTION):
+        if not collection_shard_dirs(collection):
+            self.clear(collection)
+            return
+        new_state = self._load_state(collection)
+        with self._lock:
+            self._swap_in(collection, new_state)
+
+    def clear(self, collection=None):
+        with self._lock:
+            if collection is None:
+                self._collections.clear()
+            else:
+                self._collections.pop(collection, None)
+            self.version += 1
+            for name in ([collection] if collection else list(self._versions)):
+                self._versions[name] = self.version
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Sets the IVF nprobe / HNSW efSearch used by every session (None = the value stored with
+        each index). Loaded collections are dropped and reload with the new values on their next
+        query; that also retires answers cached under the old ones.
+        """
+        if (nprobe, ef_search) == (self.nprobe, self.ef_search):
+            return
+        self.nprobe, self.ef_search = nprobe, ef_search
+        self.clear()
+
+    def version_key(self, collections=(DEFAULT_COLLECTION,)):
+        # What the answer cache is keyed on: the swap version of every searched collection
+        return tuple((c, self._versions.get(c, 0)) for c in sorted(collections))
+
+    def cache_stats(self):
+        return {
+            "query_embeddings": self.get_query_embedder().stats.as_dict(),
+            "answers": self.answer_cache.stats.as_dict(),
+        }
+
+    def is_loaded(self, collection=None):
+        return bool(self._collections) if collection is None else collection in self._collections
+
+    def loaded_collections(self):
+        return {name: len(state) for name, state in self._collections.items()}
+
+    def search(self, query, query_vector, collections=(DEFAULT_COLLECTION,), k=3, fetch_k=HYBRID_FETCH_K,
+               hybrid=True):
+        """
+        Searches every shard of the given collections for an already-embedded query and
+        merges the results into one global top k.
+
+        Each shard returns its dense top hits (and BM25 top hits when hybrid); the dense
+        lists are merged by L2 distance and the lexical lists by BM25 score, then fused
+        with reciprocal rank fusion. With more than one shard the per-shard searches run
+        in a thread pool. Shards without a BM25 side only contribute dense hits.
+        """
+        shards = [(collection, shard) for collection in collections for shard in self.get_state(collection)]
+        if not shards:
+            return []
+        query_array = np.asarray([query_vector], dtype=np.float32)
+        # Each side is cut to this before fusion, so it must never be below k
+        per_shard_k = max(k, fetch_k) if hybrid else k
+
+        def search_one(shard):
+            return _search_shard(shard[1], query, query_array, per_shard_k, hybrid)
+
+        if len(shards) == 1:
+            results = [search_one(shards[0])]
+        else:
+            with telemetry.span("shard_fanout"):
+                # Each task runs in a copy of this context, so its spans land in the caller's trace_turn()
+                futures = [_search_pool.submit(contextvars.copy_context().run, search_one, shard) for shard in shards]
+                results = [future.result() for future in futures]
+
+        dense, lexical = [], []
+        for shard_number, (shard_dense, shard_lexical) in enumerate(results):
+            dense.extend((distance, (shard_number, position)) for distance, position in shard_dense)
+            lexical.extend((score, (shard_number, position)) for position, score in shard_lexical)
+        dense_ranked = [key for _, key in sorted(dense, key=lambda hit: hit[0])[:per_shard_k]]
+        # BM25 scores use each shard's own document statistics; close enough to rank across shards
+        lexical_ranked = [key for _, key in sorted(lexical, key=lambda hit: -hit[0])[:per_shard_k]]
+        ranked = reciprocal_rank_fusion([dense_ranked, lexical_ranked]) if lexical_ranked else dense_ranked
+
+        docs = []
+        for shard_number, position in ranked[:k]:
+            collection, (vectordb, _) = shards[shard_number]
+            doc = vectordb.docstore.search(vectordb.index_to_docstore_id[position])
+            if isinstance(doc, Document):
+                doc.metadata["collection"] = collection
+                docs.append(doc)
+        return docs
+
+    def get_retriever(self, k=3, hybrid=True, collections=(DEFAULT_COLLECTION,)):
+        return RegistryRetriever(registry=self, k=k, hybrid=hybrid, collections=list(collections))
+
+
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+def _search_shard(shard, query, query_array, fetch_k, hybrid):
+    # Runs on a _search_pool thread; spans here feed the rolling stage stats
+    vectordb, bm25 = shard
+    with telemetry.span("faiss_search"):
+        distances, positions = vectordb.index.search(query_array, fetch_k)
+    dense = [(float(d), int(p)) for d, p in zip(distances[0], positions[0]) if p != -1]
+    lexical = []
+    if hybrid and bm25 is not None:
+        with telemetry.span("bm25_search"):
+            lexical = bm25.search(query, fetch_k)
+    return dense, lexical
+
+def reciprocal_rank_fusion(ranked_lists, rrf_k=RRF_K):
+    """Merges ranked lists of keys; each key scores sum(1 / (rrf_k + rank)) over the lists it appears in."""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class RegistryRetriever(BaseRetriever):
+    """
+    Read-only retriever that always searches the registry's current indexes.
+
+    With hybrid=True, dense FAISS search is combined with BM25 over the same chunks
+    (reciprocal rank fusion), so exact part numbers and clause IDs are found too. Both
+    sides return FAISS vector positions, so fusion works on integers and only the final
+    k chunks are read from the chunk store.
+    """
+
+    registry: Any
+    k: int = 3
+    fetch_k: int = HYBRID_FETCH_K
+    hybrid: bool = True
+    collections: List[str] = [DEFAULT_COLLECTION]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = self.registry.get_query_embedder().embed_query(query)
+        return self.registry.search(query, query_vector, self.collections, k=self.k, fetch_k=self.fetch_k,
+                                    hybrid=self.hybrid)
+
+
+index_registry = IndexRegistry()
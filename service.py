@@ -0,0 +1,394 @@
+"""
+Headless HTTP query service: many clients, one shared index.
+
+Every request reads the process-wide index_registry, so the FAISS index, BM25 index and
+embedding model are loaded once no matter how many conversations are open. Query
+embeddings from concurrent requests are micro-batched into one forward pass, and LLM calls
+share one client behind a concurrency limit. Each conversation_id gets its own chain memory.
+
+    python service.py --port 8080
+    python service.py --fake-llm --llm-latency 0.5   # offline, e.g. for load_test.py
+
+Endpoints:
+    POST   /ingest?collection=&shards=  multipart PDF upload (optional), then incremental re-embed
+    POST   /query                   {"conversation_id", "question", "k", "collections"} -> answer, sources, timing
+    DELETE /conversations/{id}      drop a conversation's memory
+    GET    /health, GET /stats
+"""
+import os
+import time
+import asyncio
+import argparse
+import functools
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from embeddings import (
+    DEFAULT_COLLECTION,
+    validate_collection_name,
+    load_collection_meta,
+    save_uploaded_files,
+    embed_files_from_paths,
+    list_uploaded_files,
+    migrate_legacy_layout,
+)
+from registry import index_registry
+from generation import get_llm, get_fake_llm, get_llm_chain, chat_history_str, plan_condense, answer_prompt
+from conversation_memory import MEMORY_MODES, estimate_tokens, make_memory
+from telemetry import span, trace_turn, get_query_log, stage_stats
+
+
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT_MS = 5  # How long the first query in a batch waits for company
+LLM_CONCURRENCY = 8  # In-flight LLM requests across all conversations
+MAX_CONVERSATIONS = 1000  # Least recently used conversations beyond this are dropped
+DEFAULT_K = 3
+
+
+def _run_in_executor(executor, fn, *args):
+    # Carries the request's trace_turn() context into the worker thread
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+
+class MicroBatcher:
+    """
+    Embeds concurrent requests in batches of up to max_batch texts on a dedicated thread.
+
+    A single consumer task runs one batch at a time. When it wakes up idle, the first
+    request waits up to max_wait_ms for company; after that, each batch takes everything
+    that arrived while the previous one was in the model. Under load, batches therefore
+    grow to match the arrival rate instead of being cut every max_wait_ms.
+    """
+
+    def __init__(self, embed_batch, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-batcher")
+        self._pending = []  # (text, future)
+        self._wakeup = None
+        self._consumer = None
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        if self._consumer is None or self._consumer.done():
+            # Started lazily, so it belongs to the loop serving requests
+            self._wakeup = asyncio.Event()
+            self._consumer = loop.create_task(self._consume())
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._wakeup.set()
+        return await future
+
+    async def _consume(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.max_wait)
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                await self._run(batch)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            vectors = await _run_in_executor(self._executor, self.embed_batch, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():  # The request may have been cancelled meanwhile
+                future.set_result(vector)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class LLMPool:
+    """One shared chat model client; at most `concurrency` calls are in flight at a time."""
+
+    def __init__(self, llm, concurrency=LLM_CONCURRENCY):
+        self.llm = llm
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.calls = 0
+
+    async def invoke(self, prompt):
+        async with self._semaphore:
+            self.in_flight += 1
+            self.calls += 1
+            try:
+                message = await self.llm.ainvoke(prompt)
+            finally:
+                self.in_flight -= 1
+        return getattr(message, "content", message)
+
+    def stats(self):
+        return {"concurrency": self.concurrency, "in_flight": self.in_flight, "calls": self.calls}
+
+
+class Conversation:
+    def __init__(self, llm, memory_mode):
+        memory = make_memory(memory_mode)
+        # The chain is only used for its prompts and memory; LLM calls go through the pool
+        self.chain = get_llm_chain(index_registry.get_retriever(), memory, llm=llm)
+        self.lock = asyncio.Lock()  # Turns of one conversation run in order
+
+
+class QueryService:
+    def __init__(self, llm, llm_concurrency=LLM_CONCURRENCY, max_batch=EMBED_MAX_BATCH,
+                 max_wait_ms=EMBED_MAX_WAIT_MS, max_conversations=MAX_CONVERSATIONS,
+                 memory_mode="budgeted", fast_path=True):
+        self.llm = llm
+        self.memory_mode = memory_mode
+        self.fast_path = fast_path
+        self.usage_totals = {"llm_calls": 0, "prompt_tokens": 0, "saved_llm_calls": 0, "saved_prompt_tokens": 0}
+        self.llm_pool = LLMPool(llm, llm_concurrency)
+        self.batcher = MicroBatcher(index_registry.get_query_embedder().embed_queries, max_batch, max_wait_ms)
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+        self._ingest_lock = asyncio.Lock()
+
+    def conversation(self, conversation_id):
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            conversation = self._conversations[conversation_id] = Conversation(self.llm, self.memory_mode)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def drop_conversation(self, conversation_id):
+        return self._conversations.pop(conversation_id, None) is not None
+
+    def stats(self):
+        return {
+            "embed_batcher": self.batcher.stats(),
+            "llm_pool": self.llm_pool.stats(),
+            "conversations": len(self._conversations),
+            "usage_totals": dict(self.usage_totals),
+        }
+
+    async def answer(self, conversation_id, question, k=DEFAULT_K, collections=(DEFAULT_COLLECTION,)):
+        """Same steps as generation.stream_answer, with batched embedding and pooled LLM calls."""
+        start = time.perf_counter()
+        conversation = self.conversation(conversation_id)
+        async with conversation.lock:
+            chain = conversation.chain
+            history_str = chat_history_str(chain)
+            condense, usage = plan_condense(chain, question, history_str, self.fast_path)
+            index_version = index_registry.version_key(collections)
+            cached = None
+            if condense is None:
+                # Only questions searched as asked may share answers across conversations
+                query_vector = await self.batcher.embed(question)
+                cached = index_registry.answer_cache.lookup(query_vector, index_version, question)
+            if cached:
+                answer, sources = cached
+                usage = {"llm_calls": 0, "prompt_tokens": 0, "saved_llm_calls": 0, "saved_prompt_tokens": 0}
+            else:
+                new_question = question
+                if condense is not None:
+                    with span("condense_question"):
+                        new_question = await self.llm_pool.invoke(condense)
+                    query_vector = await self.batcher.embed(new_question)
+                search = functools.partial(index_registry.search, k=k)
+                sources = await _run_in_executor(None, search, new_question, query_vector, collections)
+                prompt = answer_prompt(chain, sources, question, new_question, history_str)
+                usage["llm_calls"] += 1
+                usage["prompt_tokens"] += estimate_tokens(prompt.to_string())
+                with span("answer_llm"):
+                    answer = await self.llm_pool.invoke(prompt)
+                if condense is None:
+                    index_registry.answer_cache.store(query_vector, answer, sources, index_version, question)
+            chain.memory.save_context({"question": question}, {"answer": answer})
+        for key, value in usage.items():
+            self.usage_totals[key] += value
+        return answer, sources, bool(cached), usage, time.perf_counter() - start
+
+    async def ingest(self, uploads, collection=DEFAULT_COLLECTION, n_shards=None):
+        # A shard count different from the collection's current one rebuilds it from scratch
+        async with self._ingest_lock:
+            if uploads:
+                save_uploaded_files(uploads, collection)
+            meta = load_collection_meta(collection)
+            rebuild = bool(n_shards and meta and meta["n_shards"] != n_shards)
+            embed = functools.partial(embed_files_from_paths, incremental=not rebuild,
+                                      collection=collection, n_shards=n_shards)
+            success = await _run_in_executor(None, embed, list_uploaded_files(collection))
+            if success:
+                await _run_in_executor(None, index_registry.reload, collection)
+            return success
+
+
+class _Upload:
+    # The .name/.getbuffer() interface save_uploaded_files expects from Streamlit uploads
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+# --- HANDLERS ---
+
+async def handle_query(request):
+    service = request.app["service"]
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(reason="Body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(reason="Body must be a JSON object")
+    question = str(body.get("question") or "").strip()
+    if not question:
+        raise web.HTTPBadRequest(reason="'question' is required")
+    conversation_id = str(body.get("conversation_id") or "default")
+    k = _positive_int_param(body.get("k", DEFAULT_K), "k")
+    collections = body.get("collections") or [DEFAULT_COLLECTION]
+    if not isinstance(collections, list):
+        raise web.HTTPBadRequest(reason="'collections' must be a list of names")
+    collections = _collections_param(collections)
+    if not all(index_registry.is_loaded(c) for c in collections):
+        await _run_in_executor(None, index_registry.warm, collections)  # Loads only what is queried
+        if not any(index_registry.is_loaded(c) for c in collections):
+            raise web.HTTPServiceUnavailable(reason="No index yet for these collections; POST /ingest first")
+
+    with trace_turn() as stages:
+        answer, sources, cache_hit, usage, total = await service.answer(
+            conversation_id, question, k, collections
+        )
+    source_list = [
+        {"collection": doc.metadata.get("collection"), "source": doc.metadata.get("source"),
+         "page": doc.metadata.get("page"), "text": doc.page_content}
+        for doc in sources
+    ]
+    get_query_log().write({
+        "event": "service_turn",
+        "conversation_id": conversation_id,
+        "query": question,
+        "collections": collections,
+        "answer": answer,
+        "answer_cache_hit": cache_hit,
+        "sources": [{"collection": s["collection"], "source": s["source"], "page": s["page"]} for s in source_list],
+        "stages": stages,
+        "usage": usage,
+        "timing": {"total": total},
+    })
+    return web.json_response({
+        "conversation_id": conversation_id,
+        "answer": answer,
+        "sources": source_list,
+        "answer_cache_hit": cache_hit,
+        "usage": usage,
+        "timing": {"total": round(total, 4), "stages": stages},
+    })
+
+def _collections_param(collections):
+    try:
+        return [validate_collection_name(str(c)) for c in collections]
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=str(e))
+
+def _positive_int_param(value, name):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(reason=f"'{name}' must be an integer")
+    if value < 1:
+        raise web.HTTPBadRequest(reason=f"'{name}' must be at least 1")
+    return value
+
+async def handle_ingest(request):
+    collection = _collections_param([request.query.get("collection", DEFAULT_COLLECTION)])[0]
+    n_shards = _positive_int_param(request.query["shards"], "shards") if "shards" in request.query else None
+    uploads = []
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename and part.filename.lower().endswith(".pdf"):
+                uploads.append(_Upload(os.path.basename(part.filename), await part.read()))
+    success = await request.app["service"].ingest(uploads, collection, n_shards)
+    return web.json_response({
+        "success": bool(success),
+        "collection": collection,
+        "uploaded": [u.name for u in uploads],
+        "index_version": index_registry.version,
+    })
+
+async def handle_delete_conversation(request):
+    deleted = request.app["service"].drop_conversation(request.match_info["conversation_id"])
+    return web.json_response({"deleted": deleted})
+
+async def handle_health(request):
+    return web.json_response({"status": "ok", "index_loaded": index_registry.is_loaded(),
+                              "index_version": index_registry.version})
+
+async def handle_stats(request):
+    return web.json_response({
+        "stages": stage_stats.percentiles(),
+        **request.app["service"].stats(),
+        "caches": index_registry.cache_stats(),
+        "loaded_collections": index_registry.loaded_collections(),
+        "index_version": index_registry.version,
+    })
+
+
+def create_app(service):
+    app = web.Application(client_max_size=200 * 2**20)  # Room for multi-file PDF uploads
+    app["service"] = service
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/ingest", handle_ingest)
+    app.router.add_delete("/conversations/{conversation_id}", handle_delete_conversation)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+async def build_app(args):
+    # Built inside the running loop, so the service's asyncio locks belong to it
+    return create_app(build_service(args))
+
+def build_service(args):
+    llm = get_fake_llm(latency=args.llm_latency) if args.fake_llm else get_llm()
+    migrate_legacy_layout()
+    index_registry.warm()  # Model and index load once, before the first request
+    return QueryService(llm, llm_concurrency=args.llm_concurrency, max_batch=args.embed_batch,
+                        max_wait_ms=args.embed_wait_ms, memory_mode=args.memory_mode,
+                        fast_path=not args.no_fast_path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fake-llm", action="store_true", help="Use the offline fake LLM instead of Mistral")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument("--embed-batch", type=int, default=EMBED_MAX_BATCH)
+    parser.add_argument("--embed-wait-ms", type=float, default=EMBED_MAX_WAIT_MS)
+    parser.add_argument("--memory-mode", choices=MEMORY_MODES, default="budgeted",
+                        help="'budgeted': recent turns plus a running summary under a token cap; 'buffer': everything")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="Always condense follow-ups, even self-contained ones")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"🚀 Serving on http://{args.host}:{args.port}")
+    web.run_app(build_app(args), host=args.host, port=args.port)
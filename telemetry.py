@@ -0,0 +1,178 @@
+import io
+import os
+import json
+import time
+import queue
+import atexit
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+
+QUERY_LOG_FILE = "./query_log.jsonl"
+PROFILE_DIR = "./profiles"
+ROLLING_WINDOW = 200  # Samples kept per stage for the sidebar percentiles
+LOG_FLUSH_INTERVAL = 1.0  # Seconds
+LOG_FLUSH_LINES = 50
+
+# Display order for the sidebar; stages not listed here are shown after these
+STAGES = [
+    "pdf_load", "split", "embed", "index_write",
+    "listen", "recognition", "query_embed", "faiss_search", "bm25_search", "shard_fanout",
+    "condense_question", "answer_llm", "tts",
+]
+
+# Per-turn stage timings, collected by span() without threading a dict through every call
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_trace_lock = threading.Lock()  # Shard searches record into one turn's trace from several threads
+
+
+class StageStats:
+    """Rolling window of durations per stage, shared by the whole process."""
+
+    def __init__(self, window=ROLLING_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def percentiles(self):
+        with self._lock:
+            snapshot = {stage: np.asarray(samples) * 1000 for stage, samples in self._samples.items() if samples}
+        ordered = [s for s in STAGES if s in snapshot] + sorted(s for s in snapshot if s not in STAGES)
+        return [
+            {
+                "stage": stage,
+                "n": len(snapshot[stage]),
+                "p50_ms": round(float(np.percentile(snapshot[stage], 50)), 1),
+                "p95_ms": round(float(np.percentile(snapshot[stage], 95)), 1),
+                "p99_ms": round(float(np.percentile(snapshot[stage], 99)), 1),
+            }
+            for stage in ordered
+        ]
+
+
+stage_stats = StageStats()
+
+
+def record(stage, seconds):
+    stage_stats.record(stage, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        with _trace_lock:
+            trace[stage] = round(trace.get(stage, 0.0) + seconds, 6)
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+@contextmanager
+def trace_turn():
+    """Collects every span recorded on this thread/context into one {stage: seconds} dict."""
+    trace = {}
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class JsonlLogWriter:
+    """
+    Buffered JSONL writer: write() only enqueues; a background thread appends batches to
+    the file, keeping it open, so the UI never pays for a file open/flush per turn.
+    """
+
+    def __init__(self, path=QUERY_LOG_FILE, flush_interval=LOG_FLUSH_INTERVAL, flush_lines=LOG_FLUSH_LINES):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="jsonl-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        record.setdefault("ts", datetime.now().isoformat(timespec="milliseconds"))
+        self._queue.put(json.dumps(record, ensure_ascii=False, default=str))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        buffered = []
+        last_flush = time.monotonic()
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                try:
+                    line = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    line = ""
+                if line:
+                    buffered.append(line)
+                due = time.monotonic() - last_flush >= self.flush_interval
+                if buffered and (line is None or due or len(buffered) >= self.flush_lines):
+                    f.write("\n".join(buffered) + "\n")
+                    f.flush()
+                    buffered = []
+                    last_flush = time.monotonic()
+                if line is None:
+                    return
+
+
+_query_log = None
+_query_log_lock = threading.Lock()
+
+def get_query_log():
+    global _query_log
+    if _query_log is None:
+        with _query_log_lock:
+            if _query_log is None:
+                _query_log = JsonlLogWriter()
+    return _query_log
+
+
+@contextmanager
+def profile_run(name, enabled=True, top_n=25):
+    """
+    Optional cProfile + tracemalloc around a block (e.g. an ingest run). Yields a dict that
+    is filled in on exit with the .prof path, a top-N cumulative-time summary and the
+    peak traced memory.
+    """
+    result = {}
+    if not enabled:
+        yield result
+        return
+    profiler = cProfile.Profile()
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prof_path = os.path.join(PROFILE_DIR, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(prof_path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top_n)
+        result.update({"prof_path": prof_path, "summary": summary.getvalue(), "peak_memory_mb": round(peak / 2**20, 1)})
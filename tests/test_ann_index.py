@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from ann_index import (
+    ANN_INDEX_FILE, ANN_META_FILE, build_ann_from_flat, load_ann_meta, load_search_index, recall_at_k,
+)
+
+DIM = 16
+
+
+class FixedResults:
+    # Stands in for an index whose search always returns the same neighbour lists
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int64)
+
+    def search(self, queries, k):
+        return np.zeros(self.ids[:, :k].shape, dtype=np.float32), self.ids[:, :k]
+
+
+def exact_index(n_vectors, seed=0):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(np.random.default_rng(seed).random((n_vectors, DIM), dtype=np.float32))
+    return index
+
+
+def test_recall_counts_the_exact_neighbours_found():
+    queries = np.zeros((2, DIM), dtype=np.float32)
+    exact = FixedResults([[1, 2, 3], [4, 5, 6]])
+    approx = FixedResults([[1, 3, 9], [7, 8, 4]])
+    assert recall_at_k(approx, exact, queries, k=3) == pytest.approx(3 / 6)
+    assert recall_at_k(approx, exact, queries, k=1) == pytest.approx(1 / 2)
+
+
+def test_recall_drops_the_held_out_self_match():
+    # Both return the query row itself first; only the neighbours after it should count
+    queries = np.zeros((1, DIM), dtype=np.float32)
+    exact = FixedResults([[0, 1, 2]])
+    approx = FixedResults([[0, 8, 9]])
+    assert recall_at_k(approx, exact, queries, k=2) == pytest.approx(1 / 2)
+    assert recall_at_k(approx, exact, queries, k=2, exclude_ids=[0]) == 0.0
+
+
+def test_recall_of_the_exact_index_against_itself_is_one():
+    exact = exact_index(100)
+    rows = np.arange(0, 100, 10)
+    assert recall_at_k(exact, exact, exact.reconstruct_n(0, 100)[rows], k=5, exclude_ids=rows) == 1.0
+
+
+def test_hnsw_is_written_with_its_meta_and_loads_with_its_search_params(tmp_path):
+    exact = exact_index(500)
+    meta = build_ann_from_flat(exact, "hnsw", db_dir=str(tmp_path), ef_search=40)
+    assert meta == load_ann_meta(str(tmp_path))
+    assert meta["index_type"] == "hnsw" and meta["n_vectors"] == 500
+    assert meta["recall_queries"] == "held_out_vectors" and meta["recall_at_k"] > 0.9
+
+    index = load_search_index(str(tmp_path))
+    assert index.ntotal == 500 and index.hnsw.efSearch == 40
+    assert load_search_index(str(tmp_path), ef_search=100).hnsw.efSearch == 100
+
+
+def test_recall_uses_the_given_queries(tmp_path):
+    queries = np.random.default_rng(7).random((20, DIM), dtype=np.float32)
+    meta = build_ann_from_flat(exact_index(500), "flat", db_dir=str(tmp_path), storage="int8", queries=queries)
+    assert meta["recall_queries"] == "given"
+    assert meta["storage"] == "int8" and meta["recall_at_k"] > 0.8
+    assert isinstance(load_search_index(str(tmp_path)), faiss.IndexScalarQuantizer)
+
+
+def test_float32_flat_removes_a_stale_ann_index(tmp_path):
+    exact = exact_index(500)
+    faiss.write_index(exact, os.path.join(tmp_path, "index.faiss"))
+    build_ann_from_flat(exact, "hnsw", db_dir=str(tmp_path))
+    meta = build_ann_from_flat(exact, "flat", db_dir=str(tmp_path))
+    assert meta["recall_at_k"] == 1.0
+    assert not os.path.exists(os.path.join(tmp_path, ANN_INDEX_FILE))
+    assert not os.path.exists(os.path.join(tmp_path, ANN_META_FILE))
+    assert isinstance(load_search_index(str(tmp_path)), faiss.IndexFlatL2)
+
+
+def test_too_few_vectors_to_train_fall_back_to_flat(tmp_path):
+    meta = build_ann_from_flat(exact_index(100), "ivf_flat", db_dir=str(tmp_path))
+    assert meta["index_type"] == "flat"
+    assert load_ann_meta(str(tmp_path)) is None
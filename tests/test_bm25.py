@@ -0,0 +1,98 @@
+import math
+import numpy as np
+import pytest
+
+from bm25 import BM25_B, BM25_K1, BM25Index, tokenize
+
+TEXTS = [
+    "Replace pavement panel A-113.2 after the winter inspection.",
+    "The refund policy covers every supplier invoice.",
+    "Skid resistance of the wet asphalt surface was measured.",
+    "Drainage and the asphalt texture affect skid resistance.",
+    "The warranty clause ISO/IEC-27001 applies to the contract.",
+]
+
+
+def build(texts):
+    return BM25Index.build(enumerate(texts))
+
+
+def brute_force_scores(texts, query, k1=BM25_K1, b=BM25_B):
+    # Textbook BM25 over the same tokens, for checking the precomputed posting weights
+    docs = [tokenize(text) for text in texts]
+    avg_length = sum(len(d) for d in docs) / len(docs)
+    scores = {}
+    for term in dict.fromkeys(tokenize(query)):
+        df = sum(term in d for d in docs)
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        for position, doc in enumerate(docs):
+            tf = doc.count(term)
+            if tf:
+                norm = k1 * (1 - b + b * len(doc) / avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_tokenize_keeps_identifiers_whole_and_indexes_their_parts():
+    assert tokenize("Clause ISO/IEC-27001, part A-113.2.") == [
+        "clause", "iso/iec-27001", "iso", "iec", "27001", "part", "a-113.2", "a", "113", "2",
+    ]
+
+
+def test_exact_identifier_ranks_its_chunk_first():
+    index = build(TEXTS)
+    assert index.search("panel a-113.2", k=3)[0][0] == 0
+    assert index.search("iso/iec-27001", k=3)[0][0] == 4
+
+
+def test_results_are_sorted_positive_and_capped_at_k():
+    index = build(TEXTS)
+    results = index.search("skid resistance asphalt", k=1)
+    assert len(results) == 1
+    results = index.search("skid resistance asphalt", k=10)
+    assert {position for position, _ in results} == {2, 3}
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True) and all(score > 0 for score in scores)
+
+
+def test_unknown_and_empty_queries_return_nothing():
+    index = build(TEXTS)
+    assert index.search("zeppelin", k=5) == []
+    assert index.search("", k=5) == []
+    assert build([]).search("anything", k=5) == []
+
+
+@pytest.mark.parametrize("n_docs", [20, 400])
+def test_scores_match_textbook_bm25(n_docs):
+    rng = np.random.default_rng(n_docs)
+    words = [f"w{i}" for i in range(60)]  # Each word is in roughly a quarter of the documents
+    texts = [" ".join(rng.choice(words, size=rng.integers(5, 30))) for _ in range(n_docs)]
+    texts[3] += " rareterm"
+    index = build(texts)
+    # "rareterm" alone takes the sorted sparse-hits path, the others the dense accumulator
+    for query in ("rareterm", "w1 w7 w13", "rareterm w2", "w59"):
+        expected = brute_force_scores(texts, query)
+        got = dict(index.search(query, k=n_docs))
+        assert got.keys() == expected.keys()
+        for position, score in expected.items():
+            assert got[position] == pytest.approx(score, rel=1e-4)
+
+
+def test_query_of_only_common_terms_still_matches():
+    texts = [f"the report number {i}" for i in range(10)] + ["the refund policy"]
+    index = build(texts)
+    assert index.search("the refund", k=1)[0][0] == 10
+    assert len(index.search("the", k=3)) == 3
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build(TEXTS)
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert isinstance(loaded.doc_ids, np.memmap)
+    for query in ("a-113.2", "skid resistance", "refund supplier invoice"):
+        assert loaded.search(query, k=5) == index.search(query, k=5)
+
+
+def test_load_without_an_index_returns_none(tmp_path):
+    assert BM25Index.load(str(tmp_path)) is None
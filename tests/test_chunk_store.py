@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain_core.documents import Document
+from chunk_store import ChunkStore, ChunkStoreWriter, LazyDocstore, LazyIndexToDocstoreId
+
+TEXTS = ["pavement panel A-113", "refund policy", "skid resistance", "drainage"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "chunks.sqlite")
+    writer = ChunkStoreWriter(path)
+    writer.add([f"id-{i}" for i in range(2)], [Document(page_content=t, metadata={"source": "a.pdf", "page": i})
+                                               for i, t in enumerate(TEXTS[:2])])
+    writer.add([f"id-{i}" for i in range(2, 4)], [Document(page_content=t, metadata={"source": "b.pdf", "page": i})
+                                                  for i, t in enumerate(TEXTS[2:])])
+    writer.commit()
+    store = ChunkStore(path)
+    yield store
+    store.close()
+
+
+def test_chunks_are_found_by_position_and_by_id(store):
+    assert len(store) == 4
+    assert [store.id_at(p) for p in range(4)] == ["id-0", "id-1", "id-2", "id-3"]
+    doc = store.get("id-2")
+    assert doc.page_content == "skid resistance" and doc.metadata == {"source": "b.pdf", "page": 0}
+    assert store.get("missing") is None
+    with pytest.raises(KeyError):
+        store.id_at(4)
+
+
+def test_iteration_follows_faiss_order(store):
+    assert list(store.iter_positions()) == [0, 1, 2, 3]
+    assert list(store.iter_texts(batch_size=3)) == list(enumerate(TEXTS))
+
+
+def test_lazy_docstore_reads_through_and_is_read_only(store):
+    docstore = LazyDocstore(store)
+    assert docstore.search("id-1").page_content == "refund policy"
+    assert docstore.search("missing") == "ID missing not found."
+    with pytest.raises(NotImplementedError):
+        docstore.add({"id-9": Document(page_content="new")})
+    with pytest.raises(NotImplementedError):
+        docstore.delete(["id-1"])
+
+
+def test_lazy_index_to_docstore_id_is_a_mapping(store):
+    mapping = LazyIndexToDocstoreId(store)
+    assert len(mapping) == 4
+    assert mapping[3] == "id-3"
+    assert dict(mapping) == {p: f"id-{p}" for p in range(4)}
+    assert mapping.get(7) is None
+
+
+def test_faiss_searches_through_the_lazy_mappings(store):
+    faiss = pytest.importorskip("faiss")
+    from langchain_community.vectorstores import FAISS
+
+    vectors = np.eye(4, dtype=np.float32)
+    index = faiss.IndexFlatL2(4)
+    index.add(vectors)
+    vectordb = FAISS(None, index, LazyDocstore(store), LazyIndexToDocstoreId(store))
+    docs = vectordb.similarity_search_by_vector(vectors[2].tolist(), k=2)
+    assert docs[0].page_content == "skid resistance"
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from conversation_memory import BudgetedConversationMemory, estimate_tokens, is_self_contained, make_memory
+
+
+def budgeted(**kwargs):
+    return BudgetedConversationMemory(memory_key="chat_history", return_messages=True, output_key="answer", **kwargs)
+
+
+def say(memory, question, answer):
+    memory.save_context({"question": question}, {"answer": answer})
+
+
+@pytest.mark.parametrize("question", [
+    "What is the refund policy for supplier invoices?",
+    "How is skid resistance measured on wet asphalt?",
+])
+def test_standalone_questions_are_self_contained(question):
+    assert is_self_contained(question)
+
+
+@pytest.mark.parametrize("question", [
+    "What does it cost?",             # Pronoun
+    "And the warranty clause for suppliers?",  # Follow-up opener
+    "What about the annual review?",
+    "Refund policy?",                 # Too short to stand alone
+    "Tell me more about the contract",
+    "",
+])
+def test_follow_ups_are_not_self_contained(question):
+    assert not is_self_contained(question)
+
+
+def test_prune_keeps_the_last_turns_and_summarizes_older_ones():
+    memory = budgeted(max_turns=2, max_tokens=10_000)
+    for i in range(4):
+        say(memory, f"question {i}", f"Answer {i} first sentence. Second sentence {i}.")
+
+    assert [m.content for m in memory.chat_memory.messages] == [
+        "question 2", "Answer 2 first sentence. Second sentence 2.",
+        "question 3", "Answer 3 first sentence. Second sentence 3.",
+    ]
+    assert memory.summary == "- Q: question 0 A: Answer 0 first sentence.\n- Q: question 1 A: Answer 1 first sentence."
+
+
+def test_prune_stays_within_the_token_budget():
+    # The budget covers the summary too, so it needs room for summary_max_tokens plus a turn
+    memory = budgeted(max_turns=10, max_tokens=80, summary_max_tokens=20)
+    for i in range(6):
+        say(memory, f"question {i} " + "x" * 40, f"answer {i} " + "y" * 40)
+    assert memory.history_tokens() <= 80
+    assert 2 <= len(memory.chat_memory.messages) < 12
+
+
+def test_prune_always_keeps_the_latest_turn():
+    memory = budgeted(max_turns=4, max_tokens=10)
+    say(memory, "first question", "first answer")
+    say(memory, "second question " + "x" * 200, "second answer " + "y" * 200)
+    assert len(memory.chat_memory.messages) == 2
+    assert memory.chat_memory.messages[0].content.startswith("second question")
+
+
+def test_summary_drops_its_oldest_lines_when_over_budget():
+    memory = budgeted(max_turns=1, max_tokens=10_000, summary_max_tokens=20)
+    for i in range(6):
+        say(memory, f"question {i}", f"answer {i}.")
+    assert estimate_tokens(memory.summary) <= 20
+    assert "question 4" in memory.summary and "question 0" not in memory.summary
+
+
+def test_unbounded_tokens_counts_every_turn_and_clear_resets():
+    memory = budgeted(max_turns=1)
+    say(memory, "a" * 40, "First sentence. " + "b" * 80)
+    say(memory, "c" * 40, "First sentence. " + "d" * 80)
+    assert memory.unbounded_tokens == 2 * (10 + 24)
+    assert memory.unbounded_tokens > memory.history_tokens()
+    memory.clear()
+    assert memory.unbounded_tokens == 0 and memory.summary == "" and not memory.chat_memory.messages
+
+
+def test_summary_is_loaded_as_a_leading_system_message():
+    memory = budgeted(max_turns=1)
+    say(memory, "question 0", "Answer 0.")
+    say(memory, "question 1", "Answer 1.")
+    messages = memory.load_memory_variables({})["chat_history"]
+    assert isinstance(messages[0], SystemMessage) and "question 0" in messages[0].content
+    assert [type(m) for m in messages[1:]] == [HumanMessage, AIMessage]
+
+
+def test_make_memory_carries_messages_over_and_prunes_them():
+    messages = [SystemMessage(content="Summary of the earlier conversation:\n- old")]
+    for i in range(6):
+        messages += [HumanMessage(content=f"question {i}"), AIMessage(content=f"Answer {i}.")]
+    memory = make_memory("budgeted", messages)
+    assert len(memory.chat_memory.messages) == 2 * memory.max_turns
+    assert "question 0" in memory.summary
+    assert "old" not in memory.summary  # The previous mode's summary message is not replayed
+    with pytest.raises(ValueError):
+        make_memory("unknown")
@@ -0,0 +1,80 @@
+import itertools
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+import embedding_cache
+from embedding_cache import VECTORS_FILE, CachedEmbeddings
+
+DIM = 4
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [vector_for(text) for text in texts]
+
+    def embed_query(self, text):
+        return vector_for(text)
+
+
+def vector_for(text):
+    return np.random.default_rng(sum(text.encode())).random(DIM, dtype=np.float32).tolist()
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every call sees a later time, so last-use order is unambiguous
+    ticks = itertools.count()
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+def make_cache(tmp_path, embedder, **kwargs):
+    kwargs.setdefault("model_name", "model")
+    return CachedEmbeddings(embedder, chunk_size=100, chunk_overlap=10, cache_dir=str(tmp_path / "cache"), **kwargs)
+
+
+def test_repeated_texts_are_embedded_once(tmp_path):
+    embedder = CountingEmbedder()
+    cache = make_cache(tmp_path, embedder)
+    assert cache.embed_documents(["a", "b", "a"]) == [vector_for("a"), vector_for("b"), vector_for("a")]
+    assert cache.embed_documents(["b", "c"]) == [vector_for("b"), vector_for("c")]
+    assert embedder.embedded == ["a", "b", "c"]
+    cache.close()
+
+    reopened = make_cache(tmp_path, embedder)
+    assert reopened.embed_documents(["c", "a"]) == [vector_for("c"), vector_for("a")]
+    assert embedder.embedded == ["a", "b", "c"]
+    assert (reopened.hits, reopened.misses) == (2, 0)
+
+
+def test_eviction_keeps_recent_entries_and_renumbers_their_rows(tmp_path):
+    embedder = CountingEmbedder()
+    cache = make_cache(tmp_path, embedder, max_entries=5)
+    for i in range(5):
+        cache.embed_documents([f"text {i}"])
+    cache.embed_documents(["text 0", "text 3"])  # Now the most recently used
+    cache.embed_documents(["text 5"])  # Six entries: evicts down to 4
+
+    rows = dict(cache._db.execute("SELECT hash, row FROM entries").fetchall())
+    assert sorted(rows.values()) == [0, 1, 2, 3]
+    assert (tmp_path / "cache" / VECTORS_FILE).stat().st_size == 4 * 4 * DIM
+
+    embedder.embedded.clear()
+    kept = ["text 5", "text 0", "text 3", "text 4"]
+    assert cache.embed_documents(kept) == [vector_for(text) for text in kept]
+    assert embedder.embedded == []
+    assert cache.embed_documents(["text 1"]) == [vector_for("text 1")]
+    assert embedder.embedded == ["text 1"]
+
+
+def test_changed_model_clears_the_cache(tmp_path):
+    embedder = CountingEmbedder()
+    make_cache(tmp_path, embedder).embed_documents(["a"])
+    cache = make_cache(tmp_path, embedder, model_name="other model")
+    cache.embed_documents(["a"])
+    assert embedder.embedded == ["a", "a"]
@@ -0,0 +1,153 @@
+import os
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("langchain_huggingface")
+
+import embeddings
+from chunk_store import CHUNK_STORE_FILE, ChunkStore
+from embeddings import _plan_shard_sync
+
+
+def entry(digest, chunk_ids):
+    return {"sha256": digest, "size": 0, "mtime_ns": 0, "chunk_ids": list(chunk_ids)}
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    # Shared-content files get a fresh manifest entry, which stats the file on disk
+    def make(name):
+        path = tmp_path / name
+        path.write_bytes(b"%PDF")
+        return str(path)
+    return make
+
+
+def test_added_changed_and_removed_files():
+    manifest = {"files": {"a.pdf": entry("h1", ["a-0", "a-1"]), "b.pdf": entry("h2", ["b-0"]),
+                          "c.pdf": entry("h3", ["c-0"])}}
+    plan = _plan_shard_sync({"a.pdf": "h1", "b.pdf": "h2x", "d.pdf": "h4"}, manifest)
+
+    assert plan["dirty"]
+    assert plan["counts"] == (1, 1, 1)  # added, changed, removed
+    assert plan["jobs"] == [("b.pdf", "h2x"), ("d.pdf", "h4")]
+    assert sorted(plan["stale_ids"]) == ["b-0", "c-0"]
+    assert plan["duplicates"] == {}
+    # Changed and removed files leave the manifest until they are parsed again
+    assert list(manifest["files"]) == ["a.pdf"]
+
+
+def test_unchanged_shard_is_not_dirty():
+    manifest = {"files": {"a.pdf": entry("h1", ["a-0"])}}
+    plan = _plan_shard_sync({"a.pdf": "h1"}, manifest)
+    assert not plan["dirty"]
+    assert plan["jobs"] == [] and plan["stale_ids"] == []
+    assert list(manifest["files"]) == ["a.pdf"]
+
+
+def test_renamed_file_is_reparsed_under_its_new_path():
+    manifest = {"files": {"old.pdf": entry("h1", ["h1-0"])}}
+    plan = _plan_shard_sync({"new.pdf": "h1"}, manifest)
+    assert plan["counts"] == (1, 0, 1)
+    assert plan["jobs"] == [("new.pdf", "h1")]
+    assert plan["stale_ids"] == ["h1-0"]
+
+
+def test_new_files_with_the_same_bytes_are_parsed_once():
+    plan = _plan_shard_sync({"x.pdf": "h1", "y.pdf": "h1", "z.pdf": "h1"}, {"files": {}})
+    assert plan["jobs"] == [("x.pdf", "h1")]
+    assert plan["duplicates"] == {"x.pdf": ["y.pdf", "z.pdf"]}
+
+
+def test_new_copy_of_an_indexed_file_shares_its_chunks(pdf):
+    a, b = pdf("a.pdf"), pdf("b.pdf")
+    manifest = {"files": {a: entry("h1", ["h1-0", "h1-1"])}}
+    plan = _plan_shard_sync({a: "h1", b: "h1"}, manifest)
+    assert plan["dirty"]
+    assert plan["jobs"] == [] and plan["stale_ids"] == []
+    assert manifest["files"][b]["chunk_ids"] == ["h1-0", "h1-1"]
+
+
+def test_removing_one_of_two_copies_keeps_the_shared_chunks():
+    manifest = {"files": {"a.pdf": entry("h1", ["h1-0"]), "b.pdf": entry("h1", ["h1-0"])}}
+    plan = _plan_shard_sync({"b.pdf": "h1"}, manifest)
+    assert plan["counts"] == (0, 0, 1)
+    assert plan["stale_ids"] == []
+    assert list(manifest["files"]) == ["b.pdf"]
+
+
+def test_content_changing_to_match_another_file(pdf):
+    a, b = pdf("a.pdf"), pdf("b.pdf")
+    manifest = {"files": {a: entry("h1", ["h1-0"]), b: entry("h2", ["h2-0"])}}
+    plan = _plan_shard_sync({a: "h1", b: "h1"}, manifest)
+    assert plan["counts"] == (0, 1, 0)
+    assert plan["jobs"] == []
+    assert plan["stale_ids"] == ["h2-0"]
+    assert manifest["files"][b]["sha256"] == "h1"
+    assert manifest["files"][b]["chunk_ids"] == ["h1-0"]
+
+
+class FakeDocumentEmbedder:
+    """Deterministic stand-in for the encoder-backed chunk embedder."""
+
+    hits = misses = 0
+
+    def embed_documents(self, texts):
+        return [np.random.default_rng(abs(hash(text)) % 2**32).random(16).tolist() for text in texts]
+
+    def close(self):
+        pass
+
+
+def write_pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((50, 72), text)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def stored_chunks(collection="default"):
+    # (faiss vectors, chunk IDs in position order) across the collection's shards
+    total, ids = 0, []
+    for db_dir in embeddings.collection_shard_dirs(collection):
+        index = faiss.read_index(os.path.join(db_dir, "index.faiss"))
+        store = ChunkStore(os.path.join(db_dir, CHUNK_STORE_FILE))
+        try:
+            positions = list(store.iter_positions())
+            assert positions == list(range(index.ntotal))
+            ids.extend(store.id_at(p) for p in positions)
+        finally:
+            store.close()
+        total += index.ntotal
+    return total, ids
+
+
+def test_ingest_keeps_faiss_and_chunk_store_in_step(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embeddings, "get_document_embedder", FakeDocumentEmbedder)
+    docs_dir = tmp_path / "pdfs"
+    docs_dir.mkdir()
+    a = write_pdf(docs_dir / "a.pdf", ["Refund policy for suppliers.", "Invoices are paid in 30 days."])
+    b = write_pdf(docs_dir / "b.pdf", ["Skid resistance of wet asphalt."])
+    c = write_pdf(docs_dir / "c.pdf", ["Drainage inspection schedule."])
+
+    embeddings.embed_files_from_paths([a, b, c], n_shards=2)
+    total, ids = stored_chunks()
+    assert total == len(ids) == 4
+
+    # b changes, c is removed, d is new
+    write_pdf(docs_dir / "b.pdf", ["Skid resistance of dry asphalt.", "Texture depth."])
+    d = write_pdf(docs_dir / "d.pdf", ["Warranty clause A-113.2."])
+    embeddings.embed_files_from_paths([a, b, d], incremental=True)
+    total, ids = stored_chunks()
+    assert total == len(ids) == 5
+    manifest = embeddings.load_collection_manifest()["files"]
+    assert sorted(ids) == sorted(i for entry in manifest.values() for i in entry["chunk_ids"])
+    assert not any(name.endswith(".tmp") for _, _, files in os.walk("faiss_index") for name in files)
+
+    embeddings.embed_files_from_paths([], incremental=True)
+    assert stored_chunks() == (0, [])
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+
+pytest.importorskip("langchain_core")
+
+import encoder
+from encoder import ParallelEncoder, length_bucketed_batches
+
+# Lengths deliberately out of order: "text 7" is the shortest, the last one the longest
+TEXTS = ["text 0 " + "x" * 50, "text 1 " + "x" * 5, "text 2 " + "x" * 30, "text 3", "text 4 " + "x" * 20,
+         "text 5 " + "x" * 40, "text 6 " + "x" * 10, "text 7", "text 8 " + "x" * 70]
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        self.batches.append(list(texts))
+        return [[float(text.split()[1]), float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    # Runs _encode_batch in this process: the pool is threads, the worker's model a fake
+    model = FakeModel()
+    monkeypatch.setattr(encoder, "_worker_model", model)
+    return model
+
+
+def thread_pool_encoder(**kwargs):
+    parallel_encoder = ParallelEncoder("unused", **kwargs)
+    parallel_encoder._pool = ThreadPoolExecutor(max_workers=2)
+    return parallel_encoder
+
+
+def test_batches_cover_every_index_once_in_length_order():
+    batches = length_bucketed_batches(TEXTS, batch_size=4)
+    assert [len(batch) for batch in batches] == [4, 4, 1]
+    flat = [i for batch in batches for i in batch]
+    assert sorted(flat) == list(range(len(TEXTS)))
+    assert [len(TEXTS[i]) for i in flat] == sorted(len(text) for text in TEXTS)
+    assert length_bucketed_batches([], batch_size=4) == []
+
+
+@pytest.mark.parametrize("bucket_by_length", [True, False])
+def test_vectors_come_back_in_input_order(model, bucket_by_length):
+    parallel_encoder = thread_pool_encoder(batch_size=4, bucket_by_length=bucket_by_length)
+    vectors = parallel_encoder.embed_documents(TEXTS)
+    assert vectors == [[float(i), float(len(text))] for i, text in enumerate(TEXTS)]
+    assert parallel_encoder.embed_query("text 3") == [3.0, 6.0]
+    parallel_encoder.close()
+
+
+def test_bucketed_batches_group_similar_lengths(model):
+    parallel_encoder = thread_pool_encoder(batch_size=4)
+    parallel_encoder.embed_documents(TEXTS)
+    batches = sorted(sorted(int(text.split()[1]) for text in batch) for batch in model.batches)
+    assert batches == [[0, 2, 4, 5], [1, 3, 6, 7], [8]]  # Shortest four, next four, the longest alone
+    parallel_encoder.close()
+
+
+def test_a_broken_pool_is_discarded(monkeypatch):
+    class BrokenModel:
+        def encode(self, texts, **kwargs):
+            raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(encoder, "_worker_model", BrokenModel())
+    parallel_encoder = thread_pool_encoder()
+    with pytest.raises(BrokenProcessPool):
+        parallel_encoder.embed_documents(TEXTS)
+    assert parallel_encoder._pool is None
@@ -0,0 +1,94 @@
+from typing import List
+import pytest
+
+for module in ("langchain", "langchain_mistralai", "pyttsx3", "speech_recognition"):
+    pytest.importorskip(module)
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from conversation_memory import make_memory
+from generation import get_fake_llm, get_llm_chain, searched_as_asked, stream_answer
+
+DOCS = [Document(page_content="Refunds are paid within 30 days.", metadata={"source": "policy.pdf", "page": 2})]
+
+
+class RecordingRetriever(BaseRetriever):
+    """Returns fixed documents and remembers what it was asked to search."""
+
+    docs: List[Document]
+    queries: List[str] = []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        self.queries.append(query)
+        return self.docs
+
+
+def make_chain(responses):
+    retriever = RecordingRetriever(docs=DOCS)
+    return get_llm_chain(retriever, make_memory("budgeted"), llm=get_fake_llm(responses)), retriever
+
+
+def run_turn(chain, question, fast_path=True):
+    events = list(stream_answer(chain, question, fast_path))
+    tokens = [payload for event, payload in events if event == "token"]
+    assert [event for event, _ in events][-1] == "done"
+    return tokens, events[-1][1]
+
+
+def test_streams_the_fake_answer_and_saves_the_turn():
+    chain, retriever = make_chain(["Refunds take thirty days. Ask the supplier desk."])
+    tokens, result = run_turn(chain, "What is the refund policy for suppliers?")
+
+    assert len(tokens) > 1  # Streamed, not returned in one piece
+    assert "".join(tokens) == result["answer"] == "Refunds take thirty days. Ask the supplier desk."
+    assert result["source_documents"] == DOCS
+    assert 0 <= result["timing"]["ttft"] <= result["timing"]["total"]
+    assert result["usage"]["llm_calls"] == 1 and result["usage"]["saved_llm_calls"] == 0
+    assert result["usage"]["prompt_tokens"] > 0
+    assert retriever.queries == ["What is the refund policy for suppliers?"]
+    assert [m.content for m in chain.memory.chat_memory.messages] == [
+        "What is the refund policy for suppliers?", result["answer"],
+    ]
+
+
+def test_self_contained_follow_up_skips_condensing():
+    chain, retriever = make_chain(["First answer.", "Second answer."])
+    run_turn(chain, "What is the refund policy for suppliers?")
+    question = "How is skid resistance measured on wet asphalt?"
+    assert searched_as_asked(chain, question)
+
+    _, result = run_turn(chain, question)
+    assert result["answer"] == "Second answer."
+    assert result["usage"]["llm_calls"] == 1
+    assert result["usage"]["saved_llm_calls"] == 1 and result["usage"]["saved_prompt_tokens"] > 0
+    assert retriever.queries[-1] == question
+
+
+def test_dependent_follow_up_is_condensed_before_searching():
+    chain, retriever = make_chain(["First answer.", "What is the refund deadline for suppliers?", "Thirty days."])
+    run_turn(chain, "What is the refund policy for suppliers?")
+    assert not searched_as_asked(chain, "And how long does it take?")
+
+    _, result = run_turn(chain, "And how long does it take?")
+    assert result["answer"] == "Thirty days."
+    assert result["usage"]["llm_calls"] == 2 and result["usage"]["saved_llm_calls"] == 0
+    assert retriever.queries[-1] == "What is the refund deadline for suppliers?"
+
+
+def test_without_fast_path_every_follow_up_is_condensed():
+    chain, retriever = make_chain(["First answer.", "Condensed question about asphalt?", "Second answer."])
+    run_turn(chain, "What is the refund policy for suppliers?")
+    _, result = run_turn(chain, "How is skid resistance measured on wet asphalt?", fast_path=False)
+    assert result["usage"]["llm_calls"] == 2
+    assert retriever.queries[-1] == "Condensed question about asphalt?"
+
+
+def test_streamed_answer_matches_invoke():
+    invoke_chain, _ = make_chain(["Refunds take thirty days."])
+    stream_chain, _ = make_chain(["Refunds take thirty days."])
+    question = "What is the refund policy for suppliers?"
+    expected = invoke_chain.invoke({"question": question})
+    _, result = run_turn(stream_chain, question)
+    assert result["answer"] == expected["answer"]
+    assert result["source_documents"] == expected["source_documents"]
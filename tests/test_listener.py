@@ -0,0 +1,79 @@
+import wave
+import numpy as np
+import pytest
+
+pytest.importorskip("speech_recognition")
+
+from listener import STOP_COMMAND_RECEIVED, BackgroundListener, wav_file_sources
+
+SAMPLE_RATE = 16000
+
+
+def write_utterances_wav(path, n_utterances, tone_seconds=1.0, gap_seconds=1.2):
+    # Loud tone bursts separated by silence: the recognizer's energy VAD cuts one phrase per burst.
+    # The file ends on the last burst; listen() returns whatever is left at end of stream, so
+    # trailing silence would come back as one more (empty) utterance
+    t = np.arange(int(SAMPLE_RATE * tone_seconds)) / SAMPLE_RATE
+    tone = (np.sin(2 * np.pi * 440 * t) * 12000).astype(np.int16)
+    gap = np.zeros(int(SAMPLE_RATE * gap_seconds), dtype=np.int16)
+    samples = np.concatenate([np.concatenate([gap, tone]) for _ in range(n_utterances)])
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+def drain(listener):
+    results, timings = [], []
+    while (result := listener.poll()) is not None:
+        results.append(result)
+        timings.append(listener.last_timings)
+    return results, timings
+
+
+def test_wav_utterances_are_transcribed_in_order(tmp_path):
+    wav_path = tmp_path / "utterances.wav"
+    write_utterances_wav(wav_path, 2)
+    transcripts = iter(["What is the Refund Policy ", "Goodbye"])
+    heard = []
+
+    def transcriber(recognizer, audio):
+        heard.append(len(audio.frame_data))
+        return next(transcripts)
+
+    listener = BackgroundListener(sources=wav_file_sources([str(wav_path)]), transcriber=transcriber,
+                                  calibration_duration=0).start()
+    listener.wait_until_done(timeout=30)
+
+    results, timings = drain(listener)
+    assert results == ["what is the refund policy", STOP_COMMAND_RECEIVED]
+    assert not listener.failed()
+    assert not listener.is_running()
+    assert len(heard) == 2 and all(heard)
+    for stage_timings in timings:
+        assert stage_timings["listen"] > 0
+        assert stage_timings["recognition"] >= 0
+
+
+def test_empty_transcripts_are_not_queued(tmp_path):
+    wav_path = tmp_path / "noise.wav"
+    write_utterances_wav(wav_path, 1)
+
+    listener = BackgroundListener(sources=wav_file_sources([str(wav_path)]), transcriber=lambda r, a: "  ",
+                                  calibration_duration=0).start()
+    listener.wait_until_done(timeout=30)
+
+    assert drain(listener) == ([], [])
+    assert not listener.failed()
+
+
+def test_missing_wav_fails_the_listener(tmp_path):
+    listener = BackgroundListener(sources=wav_file_sources([str(tmp_path / "missing.wav")]),
+                                  transcriber=lambda r, a: "unused", calibration_duration=0).start()
+    listener.wait_until_done(timeout=30)
+
+    results, timings = drain(listener)
+    assert listener.failed()
+    assert len(results) == 1 and results[0].startswith("SPEECH_RECOGNITION_ERROR_PREFIX::")
+    assert timings == [{}]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from query_cache import CachedQueryEmbeddings, SemanticAnswerCache, identifier_tokens, normalize_query
+
+VERSION = (("default", 1),)
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.queries, self.batches = [], []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("What is the  Refund policy?") == normalize_query("what is the refund policy")
+
+
+def test_identifier_tokens():
+    assert identifier_tokens("Is part A-113.2 covered by ISO 27001?") == {"a-113.2", "27001"}
+    assert identifier_tokens("What is the refund policy?") == frozenset()
+
+
+def test_query_lru_reuses_and_evicts():
+    embedder = CountingEmbedder()
+    cache = CachedQueryEmbeddings(embedder, max_size=2)
+    assert cache.embed_query("Refund policy?") == cache.embed_query("refund  policy")
+    cache.embed_query("warranty")
+    cache.embed_query("refund policy")  # Refreshes it, so "warranty" is the oldest
+    cache.embed_query("drainage")
+    cache.embed_query("refund policy")
+    cache.embed_query("warranty")
+    assert embedder.queries == ["Refund policy?", "warranty", "drainage", "warranty"]
+    assert cache.stats.as_dict() == {"hits": 3, "misses": 4, "evictions": 2}
+
+
+def test_embed_queries_batches_misses_and_dedups_them():
+    embedder = CountingEmbedder()
+    cache = CachedQueryEmbeddings(embedder)
+    cache.embed_query("warranty")
+    vectors = cache.embed_queries(["Refund policy?", "warranty", "refund policy", "drainage"])
+    assert embedder.batches == [["Refund policy?", "drainage"]]
+    assert vectors == [[14.0, 1.0], [8.0, 1.0], [14.0, 1.0], [8.0, 1.0]]
+    assert cache.stats.as_dict() == {"hits": 1, "misses": 3, "evictions": 0}
+    cache.embed_queries(["drainage"])
+    assert len(embedder.batches) == 1
+
+
+def test_answer_cache_matches_close_embeddings():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "answer", ["source"], VERSION, "What is the refund policy?")
+    assert cache.lookup([0.99, 0.05], VERSION, "what's the refund policy") == ("answer", ["source"])
+    assert cache.lookup([0.0, 1.0], VERSION, "What is the refund policy?") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_answer_cache_requires_the_same_identifiers():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "A-113 answer", [], VERSION, "When is part A-113 replaced?")
+    assert cache.lookup([1.0, 0.0], VERSION, "When is part A-114 replaced?") is None
+    assert cache.lookup([1.0, 0.0], VERSION, "When is part A-113 replaced?") == ("A-113 answer", [])
+
+
+def test_answer_cache_requires_the_same_index_version():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "old answer", [], VERSION, "refund policy")
+    assert cache.lookup([1.0, 0.0], (("default", 2),), "refund policy") is None
+    cache.store([1.0, 0.0], "new answer", [], (("default", 2),), "refund policy")
+    assert cache.lookup([1.0, 0.0], (("default", 2),), "refund policy") == ("new answer", [])
+    assert cache.lookup([1.0, 0.0], VERSION, "refund policy") == ("old answer", [])
+
+
+def test_answer_cache_evicts_the_least_recently_used():
+    cache = SemanticAnswerCache(max_size=2, threshold=0.95)
+    vectors = np.eye(3).tolist()
+    for i, vector in enumerate(vectors[:2]):
+        cache.store(vector, f"answer {i}", [], VERSION, "question")
+    cache.lookup(vectors[0], VERSION, "question")  # Entry 1 is now the oldest
+    cache.store(vectors[2], "answer 2", [], VERSION, "question")
+    assert cache.lookup(vectors[1], VERSION, "question") is None
+    assert cache.lookup(vectors[0], VERSION, "question") == ("answer 0", [])
+    assert cache.stats.evictions == 1
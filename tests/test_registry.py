@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("langchain_huggingface")
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from bm25 import BM25Index
+from registry import RRF_K, IndexRegistry, reciprocal_rank_fusion
+
+DIM = 8
+
+
+def make_shard(texts, seed):
+    vectors = np.random.default_rng(seed).random((len(texts), DIM), dtype=np.float32)
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors)
+    ids = {i: f"{seed}-{i}" for i in range(len(texts))}
+    docstore = InMemoryDocstore({ids[i]: Document(page_content=text) for i, text in enumerate(texts)})
+    return FAISS(None, index, docstore, ids), BM25Index.build(enumerate(texts))
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    shards = (make_shard([f"chunk {i} about asphalt" for i in range(6)], 0),
+              make_shard([f"chunk {i} about drainage" for i in range(6)], 1))
+    registry = IndexRegistry()
+    monkeypatch.setattr(registry, "get_state", lambda collection: shards)
+    return registry
+
+
+def test_keys_in_both_lists_rank_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    assert fused[0] == "c"
+    assert fused[1] == "a"
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_single_list_keeps_its_order():
+    assert reciprocal_rank_fusion([[3, 1, 2]]) == [3, 1, 2]
+
+
+def test_empty_input():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_rank_constant_controls_how_much_the_top_ranks_dominate():
+    # "x" is first in one list, "y" third in both
+    lists = [["x", "a", "y"], ["b", "c", "y"]]
+    fused = reciprocal_rank_fusion(lists, rrf_k=RRF_K)
+    assert fused.index("y") < fused.index("x")
+    fused = reciprocal_rank_fusion(lists, rrf_k=0)
+    assert fused.index("x") < fused.index("y")
+
+
+def test_shard_position_keys_fuse_like_any_other_key():
+    dense = [(0, 5), (1, 2), (0, 7)]
+    lexical = [(1, 2), (0, 9)]
+    assert reciprocal_rank_fusion([dense, lexical])[0] == (1, 2)
+
+
+@pytest.mark.parametrize("hybrid", [False, True])
+def test_search_returns_k_chunks_when_k_exceeds_fetch_k(registry, hybrid):
+    query_vector = np.zeros(DIM, dtype=np.float32)
+    docs = registry.search("asphalt", query_vector, k=8, fetch_k=3, hybrid=hybrid)
+    assert len(docs) == 8
+    assert len({doc.page_content for doc in docs}) == 8
+
+
+def test_hybrid_search_ranks_a_chunk_found_by_both_sides_first(registry):
+    query_vector = registry.get_state("default")[1][0].index.reconstruct(4)  # Exact dense match
+    docs = registry.search("chunk 4 drainage", query_vector, k=3, fetch_k=5, hybrid=True)
+    assert docs[0].page_content == "chunk 4 about drainage"
+    assert all(doc.metadata["collection"] == "default" for doc in docs)
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("langchain")
+
+from aiohttp import test_utils
+from service import MicroBatcher, create_app
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_requests_share_batches_and_get_their_own_vectors():
+    batches = []
+
+    def embed_batch(texts):
+        batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def main():
+        batcher = MicroBatcher(embed_batch, max_batch=2, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.embed("x" * n) for n in range(1, 6))), batcher.stats()
+
+    vectors, stats = run(main())
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert stats == {"batches": 3, "texts": 5, "mean_batch_size": 1.67}
+
+
+def test_a_lone_request_waits_for_company():
+    batches = []
+
+    def embed_batch(texts):
+        batches.append(list(texts))
+        return [[0.0] for _ in texts]
+
+    async def main():
+        batcher = MicroBatcher(embed_batch, max_batch=8, max_wait_ms=50)
+        first = asyncio.ensure_future(batcher.embed("first"))
+        await asyncio.sleep(0.01)  # Arrives while the first request is still waiting
+        await asyncio.gather(first, batcher.embed("second"))
+
+    run(main())
+    assert batches == [["first", "second"]]
+
+
+def test_a_failed_batch_fails_its_requests_and_the_next_batch_still_runs():
+    calls = []
+
+    def embed_batch(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        return [[1.0] for _ in texts]
+
+    async def main():
+        batcher = MicroBatcher(embed_batch, max_batch=2, max_wait_ms=0)
+        results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+        return results, await batcher.embed("c")
+
+    results, vector = run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert vector == [1.0]
+
+
+@pytest.mark.parametrize("path, kwargs", [
+    ("/query", {"data": "not json"}),
+    ("/query", {"json": ["a", "list"]}),
+    ("/query", {"json": {"question": "  "}}),
+    ("/query", {"json": {"question": "refund policy", "k": "many"}}),
+    ("/query", {"json": {"question": "refund policy", "k": 0}}),
+    ("/query", {"json": {"question": "refund policy", "collections": "default"}}),
+    ("/query", {"json": {"question": "refund policy", "collections": ["../etc"]}}),
+    ("/ingest?collection=bad%20name", {}),
+    ("/ingest?shards=0", {}),
+])
+def test_invalid_requests_are_rejected_with_400(path, kwargs):
+    async def main():
+        # Every one of these is rejected before the service is used
+        async with test_utils.TestClient(test_utils.TestServer(create_app(service=None))) as client:
+            response = await client.post(path, **kwargs)
+            return response.status
+
+    assert run(main()) == 400
@@ -0,0 +1,210 @@
+import os
+import re
+import wave
+import queue
+import hashlib
+import time
+import threading
+import pyttsx3
+import telemetry
+
+
+TTS_RATE = 170
+TTS_CACHE_DIR = "./tts_cache"
+# Fixed phrases the app speaks over and over; synthesized once to WAV and replayed from disk
+CACHED_PHRASES = [
+    "Okay, ending voice chat.",
+    "I didn't catch that.",
+    "Please try again.",
+    "I had a speech recognition error: Could not understand audio.",
+]
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text):
+    safe_text = ''.join(char for char in text if char.isprintable())
+    return [s.strip() for s in _SENTENCE_END_RE.split(safe_text) if s.strip()]
+
+
+class TTSWorker:
+    """
+    One long-lived pyttsx3 engine on its own thread, fed from a queue of sentences.
+
+    speak() only enqueues, so the Streamlit script never waits for playback. Answers are
+    split into sentences so the first one starts playing right away, and cancel() drops
+    everything queued and interrupts the sentence being spoken. Sentences listed in
+    CACHED_PHRASES are played from pre-rendered WAV files in TTS_CACHE_DIR; missing ones are
+    rendered one at a time once the first answer has been spoken and the queue is empty, so
+    they never delay speech.
+
+    Speech runs after the turn that produced it has been logged, so sentences carry the
+    turn_id given to speak(); once a turn's speech ends (or is cancelled) the worker logs a
+    {"event": "tts", "turn_id", "stages": {"tts"}, "queue_wait"} record to join with it.
+    """
+
+    def __init__(self, rate=TTS_RATE, cache_dir=TTS_CACHE_DIR, cached_phrases=CACHED_PHRASES):
+        self.rate = rate
+        self.cache_dir = cache_dir
+        self.cached_phrases = list(cached_phrases)
+        self._queue = queue.Queue()
+        self._generation = 0  # Bumped by cancel(); queued sentences from older generations are dropped
+        self._speaking = threading.Event()
+        self._engine = None
+        self._audio = None  # One PyAudio instance for every cached phrase played
+        self._unrendered = [p for p in self.cached_phrases if not os.path.exists(self._phrase_path(p))]
+        self._drained = False  # Set once the queue first runs dry; phrase rendering waits for it
+        self._turn = None  # Speech timings of the turn being spoken, logged when it ends
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+        self._thread.start()
+
+    # --- UI THREAD API ---
+
+    def speak(self, text, turn_id=None):
+        generation = self._generation
+        queued_at = time.perf_counter()
+        sentences = split_sentences(text)
+        for i, sentence in enumerate(sentences):
+            self._queue.put((generation, sentence, turn_id, queued_at, i == len(sentences) - 1))
+
+    def cancel(self):
+        self._generation += 1
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def is_busy(self):
+        return self._speaking.is_set() or not self._queue.empty()
+
+    # --- WORKER THREAD ---
+
+    def _phrase_path(self, text):
+        key = hashlib.sha1(f"{self.rate}:{text}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _init_engine(self):
+        # pyttsx3 engines must be created and driven from the same thread
+        engine = pyttsx3.init()
+        engine.setProperty('rate', self.rate)
+        engine.connect('started-word', self._on_word)
+        return engine
+
+    def _on_word(self, name, location, length):
+        # Called from inside runAndWait(): the only safe place to interrupt the engine
+        if self._current_generation != self._generation:
+            self._engine.stop()
+
+    def _render_next_phrase(self):
+        # Called only while the queue is empty; one phrase per call so new speech waits at most one
+        phrase = self._unrendered.pop(0)
+        try:
+            if self._engine is None:
+                self._engine = self._init_engine()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._phrase_path(phrase)
+            self._engine.save_to_file(phrase, path + ".tmp.wav")
+            self._engine.runAndWait()
+            os.replace(path + ".tmp.wav", path)  # _say() never sees a half-written file
+        except Exception as e:
+            print(f"TTS: could not cache \"{phrase}\" ({e}); it will be synthesized each time.")
+
+    def _play_wav(self, path):
+        import pyaudio  # Only needed for cached phrases; speech-recognition already depends on it
+
+        if self._audio is None:
+            self._audio = pyaudio.PyAudio()
+        with wave.open(path, "rb") as wav:
+            stream = self._audio.open(format=self._audio.get_format_from_width(wav.getsampwidth()),
+                                      channels=wav.getnchannels(), rate=wav.getframerate(), output=True)
+            try:
+                frames = wav.readframes(1024)
+                while frames and self._current_generation == self._generation:
+                    stream.write(frames)
+                    frames = wav.readframes(1024)
+            finally:
+                stream.stop_stream()
+                stream.close()
+
+    def _say(self, text):
+        cached_path = self._phrase_path(text) if text in self.cached_phrases else None
+        if cached_path and os.path.exists(cached_path):
+            try:
+                self._play_wav(cached_path)
+                return
+            except Exception as e:
+                print(f"TTS: cached phrase playback failed ({e}); synthesizing instead.")
+                self._reset_audio()
+        self._engine.say(text)
+        self._engine.runAndWait()
+
+    def _reset_audio(self):
+        if self._audio is not None:
+            try:
+                self._audio.terminate()
+            except Exception:
+                pass
+            self._audio = None
+
+    def _track_turn(self, turn_id, queued_at):
+        if self._turn is not None and self._turn["turn_id"] != turn_id:
+            self._log_turn(completed=False)  # Previous turn was cancelled before its last sentence
+        if self._turn is None and turn_id is not None:
+            self._turn = {"turn_id": turn_id, "tts": 0.0, "queue_wait": time.perf_counter() - queued_at}
+
+    def _log_turn(self, completed=True):
+        turn, self._turn = self._turn, None
+        if turn is not None:
+            telemetry.get_query_log().write({
+                "event": "tts",
+                "turn_id": turn["turn_id"],
+                "completed": completed,
+                "stages": {"tts": round(turn["tts"], 6)},
+                "queue_wait": round(turn["queue_wait"], 6),
+            })
+
+    def _run(self):
+        self._current_generation = self._generation
+        while True:
+            if self._unrendered and self._drained and self._queue.empty():
+                self._render_next_phrase()
+                continue
+            generation, text, turn_id, queued_at, last = self._queue.get()
+            if generation != self._generation:
+                continue  # Cancelled while waiting in the queue
+            self._current_generation = generation
+            self._speaking.set()
+            self._track_turn(turn_id, queued_at)
+            started = time.perf_counter()
+            try:
+                if self._engine is None:
+                    self._engine = self._init_engine()
+                with telemetry.span("tts"):
+                    self._say(text)
+            except RuntimeError as e:
+                print(f"TTS pyttsx3 RuntimeError: {e}. Re-creating the engine for the next sentence.")
+                self._engine = None
+            except Exception as e:
+                print(f"TTS General Error: {e}")
+            finally:
+                if self._turn is not None:
+                    self._turn["tts"] += time.perf_counter() - started
+                    if last:
+                        self._log_turn(completed=self._current_generation == self._generation)
+                if self._queue.empty():
+                    self._speaking.clear()
+                    self._drained = True
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_tts_worker():
+    # One worker (and one audio output) per process, shared by every Streamlit session
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = TTSWorker()
+    return _worker